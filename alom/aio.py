@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+from alom.ssh import ALOMConnection, PROMPT
+from alom.exceptions import PartialResponseException, PromptTimeoutException
+
+log = logging.getLogger(__name__)
+
+
+async def read_until(channel, terminators: tuple, timeout: float, buf: bytes = b'') -> bytes:
+    """Read from a paramiko channel until one of the terminators appears in the buffer, without
+    blocking the event loop. paramiko exposes a pipe through channel.fileno() which becomes readable
+    whenever the channel has buffered data, so the event loop can wait on it like a socket.
+    Raise PromptTimeoutException holding the partial buffer if no terminator arrives within timeout seconds.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    fd = channel.fileno()
+    loop.add_reader(fd, ready.set)
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            while channel.recv_ready():
+                buf += channel.recv(4096)
+            if any(terminator in buf for terminator in terminators):
+                return buf
+            if channel.closed or channel.eof_received:
+                raise PromptTimeoutException(buf)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise PromptTimeoutException(buf)
+            ready.clear()
+            try:
+                await asyncio.wait_for(ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise PromptTimeoutException(buf)
+    finally:
+        loop.remove_reader(fd)
+
+
+class AsyncALOMSession:
+    """AsyncALOMSession drives an ALOMConnection from an asyncio event loop. Instead of sleeping for a fixed
+    delay and hoping the whole response has arrived, each read completes as soon as the controller prints
+    its next prompt, so many controllers can share one event loop without a thread each.
+    ALOMConnection's blocking context manager and showenvironment() run this same code on a loop of their own.
+    """
+
+    def __init__(self, connection: ALOMConnection):
+        self.connection = connection
+        self.name = connection.name
+        self.config = connection.config
+
+    def increase_backoff(self):
+        return self.connection.increase_backoff()
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        # paramiko's connection setup is blocking, so it's handed off to a worker thread
+        await loop.run_in_executor(None, self.connection.open_channel)
+        self.connection.channel.setblocking(0)
+        started = loop.time()
+        authenticated = await self.authenticate()
+        self.connection.phases['auth'].observe(loop.time() - started)
+        if not authenticated:
+            self.close()
+            raise Exception(f'ALOM authentication failed for {self.name}')
+        log.debug(f'Connection to {self.name} successful')
+        return self
+
+    def close(self):
+        if self.connection.client is not None:
+            self.connection.client.close()
+
+    @property
+    def alive(self) -> bool:
+        channel = self.connection.channel
+        if channel is None or channel.closed or channel.eof_received:
+            return False
+        transport = self.connection.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    async def keepalive(self):
+        """Send an empty line and wait for the prompt to come back. This resets the ALOM's idle timer
+        and proves the session still works, at the cost of a few bytes."""
+        channel = self.connection.channel
+        channel.send('\n')
+        await read_until(channel, (PROMPT,), self.config['command_timeout'])
+
+    async def authenticate(self) -> bool:
+        channel = self.connection.channel
+        timeout = self.config['command_timeout']
+        await read_until(channel, (b'Please login:',), timeout)
+        channel.send(self.config['alom_ssh_username'] + '\n')
+        buf = await read_until(channel, (b'Please Enter password:', PROMPT), timeout)
+        if b'Please Enter password:' not in buf:
+            log.warning(f'Authentication failed before sending password {buf}')
+            return False
+        sent = channel.send(self.config['alom_ssh_password'] + '\n')
+        # A rejected password brings back the login prompt rather than the command prompt
+        buf = await read_until(channel, (PROMPT, b'Please login:'), timeout)
+        buf = buf[sent + 1 :]
+        if PROMPT in buf:
+            log.info(f'Authentication to {self.name} succeeded!')
+            return True
+        log.warning(f'Authentication failed after sending password: {buf}')
+        return False
+
+    async def command(self, command: str) -> (bytes, int):
+        """Send a command and return the raw response up to and including the next prompt,
+        along with the number of bytes sent."""
+        channel = self.connection.channel
+        loop = asyncio.get_running_loop()
+        # The tail of an earlier response which timed out would otherwise be read as the start of this one
+        while channel.recv_ready():
+            log.debug(f'Discarding {len(channel.recv(4096))} stale bytes from {self.name}')
+        sent = channel.send(command + '\n')
+        started = loop.time()
+        try:
+            # The previous read ended at a prompt, so the next prompt marks the end of this response
+            buf = await read_until(channel, (PROMPT,), self.config['command_timeout'])
+        except PromptTimeoutException as e:
+            buf = await self.backoff_read(e.buf)
+        else:
+            self.connection.record_response_time(command, loop.time() - started)
+        finally:
+            self.connection.phases['command'].observe(loop.time() - started)
+        return buf, sent
+
+    async def backoff_read(self, buf: bytes) -> bytes:
+        """Fallback for a response whose prompt never arrived: wait out the backoff delay and take
+        whatever else the controller sent. Only the prompt shows the response is complete, so without it
+        the response is partial, and PartialResponseException is raised for the caller to increase the backoff."""
+        backoff = self.connection.get_backoff()
+        log.warning(f'No prompt from {self.name}, waiting {backoff}s for the rest of the response')
+        started = time.monotonic()
+        await asyncio.sleep(backoff)
+        channel = self.connection.channel
+        while channel.recv_ready():
+            buf += channel.recv(4096)
+        self.connection.phases['backoff'].observe(time.monotonic() - started)
+        if PROMPT not in buf:
+            raise PartialResponseException()
+        return buf
+
+    async def showenvironment(self) -> bytes:
+        """Return the raw "showenvironment" response, undecoded; see alom.parse.parse_showenvironment_bytes"""
+        buf, sent = await self.command('showenvironment')
+        return self.connection.environment_bytes(buf, sent)
+
+    async def run_command(self, command: str) -> str:
+        buf, sent = await self.command(command)
+        return self.connection.command_response(buf, sent)
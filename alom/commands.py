@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+from alom.parse_faults import parse_showfaults
+from alom.parse_logs import parse_consolehistory, parse_showlogs
+from alom.parse_platform import parse_showplatform
+from alom.parse_power import parse_showpower
+
+# An ALOM command collected alongside "showenvironment" on its own schedule.
+#   parse: stripped response lines -> parsed data
+#   interval: default seconds between runs, overridden per target under "commands" in the configuration
+#   families: metric family name -> documentation
+#   render: (target, parsed data) -> list of (family name, labels, value) samples
+#   incremental: the command prints a log; only entries added since the last run are read, see LogPoller
+Command = namedtuple('Command', ['name', 'parse', 'interval', 'families', 'render', 'incremental'])
+
+COMMANDS = {}
+
+
+def register(command: Command):
+    COMMANDS[command.name] = command
+    return command
+
+
+def render_faults(target: str, faults: list) -> list:
+    samples = [('alom_faults', [('target', target)], len(faults))]
+    samples.extend(
+        ('alom_fault', [('target', target), ('id', fault['id']), ('fru', fault['fru']), ('fault', fault['fault'])], 1)
+        for fault in faults
+    )
+    return samples
+
+
+def render_platform(target: str, platform: dict) -> list:
+    samples = [('alom_platform_info', [('target', target), ('model', platform['model']), ('serial', platform['serial'])], 1)]
+    samples.extend(
+        ('alom_domain_status', [('target', target), ('domain', domain), ('status', status)], 1)
+        for domain, status in platform['domains'].items()
+    )
+    return samples
+
+
+def render_nothing(target: str, data) -> list:
+    # Log entries are counted by alom_log_events_total as they are read, rather than rendered from a snapshot
+    return []
+
+
+def render_power(target: str, power: dict) -> list:
+    samples = []
+    for supply, readings in power['supplies'].items():
+        labels = [('target', target), ('supply', supply)]
+        samples.append(('alom_power_supply_input_watts', labels, readings['InputPower']))
+        samples.append(('alom_power_supply_output_watts', labels, readings['OutputPower']))
+    if power['total']:
+        samples.append(('alom_system_input_watts', [('target', target)], power['total']['InputPower']))
+        samples.append(('alom_system_output_watts', [('target', target)], power['total']['OutputPower']))
+    return samples
+
+
+register(
+    Command(
+        'showfaults',
+        parse_showfaults,
+        300.0,
+        {
+            'alom_faults': 'Number of faults reported by the ALOM',
+            'alom_fault': 'Fault reported by the ALOM, with its FRU and description',
+        },
+        render_faults,
+        False,
+    )
+)
+register(
+    Command(
+        'showplatform',
+        parse_showplatform,
+        3600.0,
+        {
+            'alom_platform_info': 'Platform model and chassis serial number',
+            'alom_domain_status': 'Status of each domain as reported by the ALOM',
+        },
+        render_platform,
+        False,
+    )
+)
+register(Command('showlogs', parse_showlogs, 300.0, {}, render_nothing, True))
+register(Command('consolehistory', parse_consolehistory, 300.0, {}, render_nothing, True))
+register(
+    Command(
+        'showpower',
+        parse_showpower,
+        60.0,
+        {
+            'alom_power_supply_input_watts': 'Input power of power supplies in watts',
+            'alom_power_supply_output_watts': 'Output power of power supplies in watts',
+            'alom_system_input_watts': 'Total input power of all power supplies in watts',
+            'alom_system_output_watts': 'Total output power of all power supplies in watts',
+        },
+        render_power,
+        False,
+    )
+)
@@ -0,0 +1,73 @@
+# Properties which every target needs before a connection can be attempted
+required_properties = ['alom_ssh_address', 'alom_ssh_username', 'alom_ssh_password']
+
+
+def with_defaults(config: dict) -> dict:
+    """Return a copy of a target's configuration with defaults filled in for how it is polled. Defaults for
+    the SSH session itself are filled in by alom.ssh.ALOMConnection."""
+    config = dict(config)
+    # Environmental status is polled in the background on this interval, and a snapshot older than
+    # the max age is treated as a failed scrape.
+    if not 'poll_interval' in config:
+        config['poll_interval'] = 30.0
+    if not 'max_snapshot_age' in config:
+        config['max_snapshot_age'] = config['poll_interval'] * 3
+    # Other commands to collect, mapping command name -> seconds between runs (None for the command's default).
+    # See alom/commands.py for the commands available.
+    if not config.get('commands'):
+        config['commands'] = {}
+    # Log commands (showlogs, consolehistory) first ask for the last log_window lines, doubling up to
+    # max_log_window until the last entry seen before is found. log_state_path keeps that position across
+    # restarts, and log_events_path streams new entries as JSON lines to a file, or stdout for "-".
+    if not 'log_window' in config:
+        config['log_window'] = 10
+    if not 'max_log_window' in config:
+        config['max_log_window'] = 640
+    # A failed poll is retried after this many seconds, doubling up to the poll interval, while the last
+    # good snapshot keeps being served
+    if not 'retry_delay' in config:
+        config['retry_delay'] = 5.0
+    # Keep the last history_size readings of each sensor, exported as their min, max and mean over the last
+    # history_window seconds and served on /history. Off unless history_size is set.
+    if not 'history_size' in config:
+        config['history_size'] = 0
+    if not 'history_window' in config:
+        config['history_window'] = 60.0
+    # Status, threshold, indicator and power values which change between polls are counted in
+    # alom_environment_changes_total. change_events_path streams each change as a JSON line to a file, or
+    # stdout for "-", and change_webhook_url POSTs them to a URL as JSON arrays. Both are off unless set.
+    return config
+
+
+def load_targets(config_path: str) -> dict:
+    """Read a YAML configuration file and return a mapping of target name -> connection configuration.
+
+    A fleet configuration lists each controller under a "targets" key. Every other top-level key
+    is a default which is applied to each target unless the target overrides it:
+
+        alom_ssh_username: exporter
+        alom_ssh_password: changeme
+        targets:
+          t2000-a:
+            alom_ssh_address: 192.168.1.231
+          t1000-b:
+            alom_ssh_address: 192.168.1.232
+
+    A configuration without a "targets" key is treated as a single target named after its address,
+    so configuration files from earlier versions keep working.
+    """
+    # Imported here so code which only needs required_properties, like alom.ssh, doesn't load yaml
+    import yaml
+
+    with open(config_path, 'r') as stream:
+        config = yaml.safe_load(stream) or {}
+    if 'targets' not in config:
+        name = config.get('alom_ssh_address', 'default')
+        return {name: config}
+    defaults = {k: v for k, v in config.items() if k != 'targets'}
+    targets = {}
+    for name, target_config in (config['targets'] or {}).items():
+        merged = dict(defaults)
+        merged.update(target_config or {})
+        targets[str(name)] = merged
+    return targets
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from alom.history import READINGS
+from alom.snapshot import Table
+
+# One value which differs between two snapshots of a target. item is the sensor, supply or indicator, or in
+# the power table "system" or a category; field is the column, or None for indicators and power. A value
+# which appeared or went away is None on that side. A table row which appeared or went away is one change
+# with field None, and the row's values as a dict on the other side.
+Change = namedtuple('Change', ['category', 'item', 'field', 'old', 'new'])
+
+
+def diff_flat(category: str, previous: dict, current: dict) -> list:
+    """Changes between two mappings of item -> value, such as the power or indicator tables"""
+    if previous == current:
+        return []
+    return [
+        Change(category, item, None, previous.get(item), current.get(item))
+        for item in dict.fromkeys([*previous, *current])
+        if previous.get(item) != current.get(item)
+    ]
+
+
+def diff_table(category: str, previous, current) -> list:
+    """Changes between two versions of a sensor table, leaving out its readings column (see alom.history),
+    which varies from one poll to the next and is exported as it is instead"""
+    if previous is current or previous == current:
+        return []
+    reading = READINGS.get(category)
+    if isinstance(previous, Table) and isinstance(current, Table) and previous.names == current.names:
+        # Same sensors: compare whole columns, and only look at rows in the few that differ
+        changes = []
+        for column in current.schema.columns:
+            if column == reading:
+                continue
+            old, new = previous.column(column), current.column(column)
+            if old is None:
+                old = [None] * len(current.names)
+            if old != new:
+                changes.extend(
+                    Change(category, sensor, column, old_value, new_value)
+                    for sensor, old_value, new_value in zip(current.names, old, new)
+                    if old_value != new_value
+                )
+        return changes
+    changes = []
+    for sensor in dict.fromkeys([*previous, *current]):
+        old, new = previous.get(sensor), current.get(sensor)
+        if old is None or new is None:
+            changes.append(Change(category, sensor, None, old and dict(old), new and dict(new)))
+            continue
+        for column in dict.fromkeys([*old, *new]):
+            if column != reading and old.get(column) != new.get(column):
+                changes.append(Change(category, sensor, column, old.get(column), new.get(column)))
+    return changes
+
+
+def diff(previous: dict, current: dict) -> list:
+    """Return the Changes between two parsed "showenvironment" responses of one target.
+    A table present in only one of them, as happens when the system is powered on or off, is covered
+    by the change to the power table rather than a change for every row in it."""
+    changes = diff_flat('power', previous.get('power', {}), current.get('power', {}))
+    changes.extend(diff_flat('indicator', previous.get('indicator', {}), current.get('indicator', {})))
+    for category, table in current.items():
+        if category in ('power', 'indicator') or category not in previous:
+            continue
+        changes.extend(diff_table(category, previous[category], table))
+    return changes
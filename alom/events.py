@@ -0,0 +1,81 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import urllib.request
+
+log = logging.getLogger(__name__)
+
+# One sink per path or URL, so every target configured with the same one shares a single stream
+_sinks = {}
+
+
+class JSONLinesSink:
+    """Appends one JSON object per line to a file, or to stdout when the path is "-".
+    Each line is flushed as it is written so a tailing reader sees events as they arrive."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stream = sys.stdout if path == '-' else open(path, 'a')
+
+    def write(self, record: dict):
+        self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self.stream.flush()
+
+
+def sink_for(path: str) -> JSONLinesSink:
+    if path not in _sinks:
+        _sinks[path] = JSONLinesSink(path)
+    return _sinks[path]
+
+
+class WebhookSink:
+    """POSTs records to a URL as a JSON array from a background thread, so a slow or unreachable receiver
+    never holds up polling. Records written while a request is in flight go out together in the next one.
+    Once max_queued records are waiting, further ones are dropped, and a request which fails is not retried."""
+
+    def __init__(self, url: str, timeout: float = 10.0, max_queued: int = 10000, max_batch: int = 1000):
+        self.url = url
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.queue = queue.Queue(max_queued)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='alom-webhook', daemon=True)
+        self.thread.start()
+
+    def write(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            log.warning(f'Dropped an event for {self.url}, {self.queue.maxsize} are waiting to be sent')
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.max_batch:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.post(records)
+
+    def post(self, records: list):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(records, sort_keys=True).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except Exception as e:
+            log.warning(f'Failed to send {len(records)} events to {self.url}: {e}')
+
+
+def webhook_for(url: str) -> WebhookSink:
+    if url not in _sinks:
+        _sinks[url] = WebhookSink(url)
+    return _sinks[url]
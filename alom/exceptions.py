@@ -1,2 +1,10 @@
 class PartialResponseException(Exception):
     ...
+
+
+class PromptTimeoutException(Exception):
+    """The ALOM prompt didn't come back in time. Whatever was read before giving up is kept in buf."""
+
+    def __init__(self, buf: bytes = b''):
+        super().__init__(f'Prompt not received after {len(buf)} bytes')
+        self.buf = buf
@@ -0,0 +1,15 @@
+from prometheus_client.utils import floatToGoString
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def header(name: str, documentation: str) -> bytes:
+    return f'# HELP {name} {documentation}\n# TYPE {name} gauge\n'.encode('utf-8')
+
+
+def sample(name: str, labels: list, value: float) -> str:
+    """One line of the text exposition format; labels is a list of (name, value) pairs"""
+    label_text = ','.join(f'{label}="{escape(str(label_value))}"' for label, label_value in labels)
+    return f'{name}{{{label_text}}} {floatToGoString(value)}\n'
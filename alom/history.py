@@ -0,0 +1,129 @@
+import threading
+from array import array
+
+from alom.snapshot import column_items
+
+# The column of each table holding the sensor's reading, which is what history is kept of
+READINGS = {
+    'temperature': 'Temp',
+    'fans': 'Speed',
+    'voltage': 'Voltage',
+    'load': 'Load',
+}
+
+
+class Ring:
+    """The last size (timestamp, reading) samples of one sensor, in two preallocated arrays of doubles,
+    so a full ring never allocates and takes 16 bytes per sample however long it runs."""
+
+    __slots__ = ('timestamps', 'values', 'start', 'count')
+
+    def __init__(self, size: int):
+        self.timestamps = array('d', bytes(8 * size))
+        self.values = array('d', bytes(8 * size))
+        # Index of the oldest sample, and the number of samples held
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp: float, value: float):
+        size = len(self.values)
+        index = (self.start + self.count) % size
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+        if self.count < size:
+            self.count += 1
+        else:
+            # Full: the oldest sample was just overwritten
+            self.start = (self.start + 1) % size
+
+    def samples(self) -> list:
+        """Every sample held, oldest first, as (timestamp, value) pairs"""
+        size = len(self.values)
+        indexes = [(self.start + offset) % size for offset in range(self.count)]
+        return [(self.timestamps[index], self.values[index]) for index in indexes]
+
+    def summary(self, since: float) -> (float, float, float):
+        """Return the min, max and mean of the samples taken at or after since, or None if there are none"""
+        size = len(self.values)
+        low = high = total = None
+        taken = 0
+        # Newest first, stopping at the first sample older than the window
+        for offset in range(self.count - 1, -1, -1):
+            index = (self.start + offset) % size
+            if self.timestamps[index] < since:
+                break
+            value = self.values[index]
+            if taken == 0:
+                low = high = total = value
+            else:
+                low = min(low, value)
+                high = max(high, value)
+                total += value
+            taken += 1
+        if taken == 0:
+            return None
+        return low, high, total / taken
+
+
+class TargetHistory:
+    """TargetHistory keeps a Ring of readings for each sensor of one target, fed from every new snapshot.
+    Polling faster than Prometheus scrapes then catches excursions between scrapes: summary maps
+    (category, sensor) -> (min, max, mean) of the readings within the last window seconds, and is
+    replaced wholesale on each record() so readers on other threads never see it half-updated.
+    Memory is fixed at size samples per sensor.
+    """
+
+    def __init__(self, size: int, window: float):
+        self.size = size
+        self.window = window
+        self.rings = {}
+        self.summary = {}
+        # Snapshots are recorded on the poller's thread while /history is served from HTTP threads
+        self._lock = threading.Lock()
+
+    def record(self, snapshot):
+        timestamp = snapshot.timestamp
+        with self._lock:
+            for category, column in READINGS.items():
+                for sensor, value in column_items(snapshot.data.get(category, {}), column):
+                    key = (category, sensor)
+                    ring = self.rings.get(key)
+                    if ring is None:
+                        ring = self.rings[key] = Ring(self.size)
+                    ring.append(timestamp, value)
+            since = timestamp - self.window
+            summary = {}
+            for key, ring in self.rings.items():
+                values = ring.summary(since)
+                # Sensors missing from recent snapshots, such as those which can't be read while powered off
+                if values is not None:
+                    summary[key] = values
+        self.summary = summary
+
+    def series(self, sensor: str) -> list:
+        """Return the samples held for a sensor in each category it appears in, for the /history endpoint"""
+        result = []
+        with self._lock:
+            for (category, name), ring in self.rings.items():
+                if name != sensor:
+                    continue
+                samples = ring.samples()
+                series = {
+                    'category': category,
+                    'column': READINGS[category],
+                    'timestamps': [timestamp for timestamp, _ in samples],
+                    'values': [value for _, value in samples],
+                }
+                summary = self.summary.get((category, name))
+                if summary is not None:
+                    series['min'], series['max'], series['avg'] = summary
+                result.append(series)
+        return result
+
+
+def history_for(config: dict):
+    """Return a TargetHistory for a target's configuration, or None if it doesn't keep history"""
+    size = config.get('history_size', 0)
+    if not size:
+        return None
+    return TargetHistory(size, config.get('history_window', 60.0))
@@ -0,0 +1,84 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Controllers answer anywhere from a few hundred milliseconds (powered off) to several seconds (powered on)
+RESPONSE_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 20.0)
+
+command_duration = Histogram(
+    'alom_command_duration_seconds',
+    'Time between sending a command to the ALOM and its prompt returning',
+    ['target', 'command'],
+    buckets=RESPONSE_BUCKETS,
+)
+
+session_reconnects = Counter(
+    'alom_session_reconnects',
+    'Number of times the SSH session to the ALOM was reopened after failing',
+    ['target'],
+)
+
+command_queue_depth = Gauge(
+    'alom_command_queue_depth',
+    'Commands waiting for or holding the channel to the ALOM',
+    ['target'],
+)
+
+command_wait = Histogram(
+    'alom_command_wait_seconds',
+    'Time a command waited for its turn on the channel to the ALOM',
+    ['target'],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+log_events = Counter(
+    'alom_log_events',
+    'Entries read from the ALOM event log and host console history',
+    ['target', 'command', 'severity', 'source'],
+)
+
+environment_changes = Counter(
+    'alom_environment_changes',
+    'Status, threshold, indicator and power values which changed between two polls of "showenvironment"',
+    ['target', 'category'],
+)
+
+# Parsing and rendering take milliseconds, connecting and logging in take seconds
+PHASE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+phase_duration = Histogram(
+    'alom_phase_duration_seconds',
+    'Time spent in each phase of collecting from the ALOM: connect, auth, command, backoff, parse and render',
+    ['target', 'phase'],
+    buckets=PHASE_BUCKETS,
+)
+
+partial_responses = Counter(
+    'alom_partial_responses',
+    'Responses from the ALOM which were cut short and could not be parsed',
+    ['target'],
+)
+
+backoff_increases = Counter(
+    'alom_backoff_increases',
+    'Number of times the delay for waiting out a response without a prompt was increased',
+    ['target'],
+)
+
+backoff_seconds = Gauge(
+    'alom_backoff_seconds',
+    'Current delay for waiting out a response without a prompt',
+    ['target'],
+)
+
+# Everything above is labelled by target, so a sharded exporter gathers it from the worker owning each target
+TARGET_METRICS = (
+    command_duration,
+    session_reconnects,
+    command_queue_depth,
+    command_wait,
+    log_events,
+    environment_changes,
+    phase_duration,
+    partial_responses,
+    backoff_increases,
+    backoff_seconds,
+)
@@ -0,0 +1,166 @@
+"""Load test the exporter against many simulated controllers.
+
+Starts N fake ALOMs (see alom.replay), runs alom_exporter against them in a subprocess, scrapes its
+/metrics endpoint at a fixed rate and reports scrape latency percentiles along with the exporter's CPU
+time, resident memory and open file descriptors. Resource figures are read from /proc, so are only
+reported on Linux.
+"""
+import argparse
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import paramiko
+import yaml
+
+from alom.replay import FakeALOMServer, ReplaySession
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of values"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def process_stats(pid: int) -> dict:
+    """CPU seconds, resident memory and open file descriptors of a process, from /proc"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as fh:
+            # Fields after the command name, which is in parentheses and may contain spaces
+            fields = fh.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status', 'r') as fh:
+            rss_kib = next(int(line.split()[1]) for line in fh if line.startswith('VmRSS:'))
+        fds = len(os.listdir(f'/proc/{pid}/fd'))
+    except (OSError, StopIteration):
+        return {}
+    ticks = os.sysconf('SC_CLK_TCK')
+    return {'cpu_seconds': (int(fields[11]) + int(fields[12])) / ticks, 'rss_mib': rss_kib / 1024, 'fds': fds}
+
+
+def healthy_targets(body: str) -> int:
+    return sum(1 for line in body.splitlines() if line.startswith('alom_ok{') and line.endswith(' 1.0'))
+
+
+def run_load_test(
+    targets: int,
+    environment: str,
+    duration: float = 30.0,
+    rate: float = 1.0,
+    delay: float = 0.8,
+    stall_rate: float = 0.0,
+    stall_time: float = 15.0,
+    poll_interval: float = 30.0,
+    port: int = 9897,
+    startup_timeout: float = 120.0,
+    exporter_args: list = None,
+) -> dict:
+    """Run the exporter against simulated controllers and return a report of what was measured"""
+    with open(environment, 'r') as fh:
+        session = ReplaySession.synthesize(fh.read(), 'loadtest', 'loadtest', delay=delay)
+    host_key = paramiko.RSAKey.generate(2048)
+    servers = [
+        FakeALOMServer(session, stall_rate=stall_rate, stall_time=stall_time, host_key=host_key).start()
+        for _ in range(targets)
+    ]
+    config = {
+        'alom_ssh_username': 'loadtest',
+        'alom_ssh_password': 'loadtest',
+        'poll_interval': poll_interval,
+        'targets': {
+            f'fake{idx}': {'alom_ssh_address': '127.0.0.1', 'alom_ssh_port': server.port}
+            for idx, server in enumerate(servers)
+        },
+    }
+    url = f'http://127.0.0.1:{port}/metrics'
+    report = {'targets': targets, 'scrapes': 0, 'errors': 0}
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml') as config_file:
+        yaml.safe_dump(config, config_file)
+        config_file.flush()
+        command = [sys.executable, '-m', 'alom.metrics', '-c', config_file.name, '--port', str(port)]
+        exporter = subprocess.Popen(command + (exporter_args or []), stderr=subprocess.DEVNULL)
+        try:
+            # Wait until every target has been polled once, so logins don't count against scrape latency
+            started = time.monotonic()
+            healthy = 0
+            while time.monotonic() - started < startup_timeout:
+                try:
+                    with urllib.request.urlopen(url, timeout=5) as response:
+                        healthy = healthy_targets(response.read().decode('utf-8'))
+                except OSError:
+                    pass
+                if healthy == targets:
+                    break
+                time.sleep(0.5)
+            report['startup_seconds'] = time.monotonic() - started
+            report['healthy_at_startup'] = healthy
+            before = process_stats(exporter.pid)
+            latencies = []
+            healthy_counts = []
+            measured = time.monotonic()
+            next_scrape = measured
+            while time.monotonic() - measured < duration:
+                next_scrape += 1 / rate
+                scrape_started = time.monotonic()
+                try:
+                    with urllib.request.urlopen(url, timeout=30) as response:
+                        body = response.read().decode('utf-8')
+                    latencies.append(time.monotonic() - scrape_started)
+                    healthy_counts.append(healthy_targets(body))
+                except OSError:
+                    report['errors'] += 1
+                time.sleep(max(next_scrape - time.monotonic(), 0))
+            elapsed = time.monotonic() - measured
+            after = process_stats(exporter.pid)
+        finally:
+            exporter.terminate()
+            exporter.wait()
+            for server in servers:
+                server.stop()
+    report['scrapes'] = len(latencies)
+    for pct in (50, 95, 99):
+        report[f'p{pct}_seconds'] = percentile(latencies, pct)
+    report['max_seconds'] = max(latencies) if latencies else float('nan')
+    report['min_healthy'] = min(healthy_counts) if healthy_counts else 0
+    if before and after:
+        report['cpu_percent'] = 100 * (after['cpu_seconds'] - before['cpu_seconds']) / elapsed
+        report['rss_mib'] = after['rss_mib']
+        report['fds'] = after['fds']
+    return report
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('-n', '--targets', help='Number of simulated controllers', default=10, type=int)
+    p.add_argument('-e', '--environment', help='Saved "showenvironment" output to answer with', required=True)
+    p.add_argument('--duration', help='Seconds to scrape for', default=60.0, type=float)
+    p.add_argument('--rate', help='Scrapes of /metrics per second', default=1.0, type=float)
+    p.add_argument('--delay', help='Seconds each controller takes to answer', default=0.8, type=float)
+    p.add_argument('--stall-rate', help='Fraction of answers which stall partway through', default=0.0, type=float)
+    p.add_argument('--stall-time', help='Seconds a stalled answer stalls for', default=15.0, type=float)
+    p.add_argument('--poll-interval', help='poll_interval given to the exporter', default=30.0, type=float)
+    p.add_argument('--port', help='Port for the exporter under test', default=9897, type=int)
+    args = p.parse_args()
+    report = run_load_test(
+        args.targets,
+        args.environment,
+        duration=args.duration,
+        rate=args.rate,
+        delay=args.delay,
+        stall_rate=args.stall_rate,
+        stall_time=args.stall_time,
+        poll_interval=args.poll_interval,
+        port=args.port,
+    )
+    for key, value in report.items():
+        print(f'{key:20} {value:.3f}' if isinstance(value, float) else f'{key:20} {value}')
+
+
+if __name__ == '__main__':
+    main()
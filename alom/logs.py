@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# Number of trailing log entries remembered as the cursor. A single entry isn't enough
+# to find our place again, since the same message often repeats within a second.
+CURSOR_LENGTH = 3
+
+# One state per path, so every target configured with the same path shares a single file
+_states = {}
+
+
+def cursor_key(target: str, command: str) -> str:
+    """Key of the cursor of one log command of one target in a LogState"""
+    return f'{target}/{command}'
+
+
+def fingerprint(event: dict) -> str:
+    return '\x1f'.join((event['time'], event['source'], event['message']))
+
+
+def cursor_after(events: list) -> list:
+    return [fingerprint(event) for event in events[-CURSOR_LENGTH:]]
+
+
+def unseen(events: list, cursor: list) -> (list, bool):
+    """Return the events which come after the cursor, and whether the cursor was found at all.
+    When it wasn't, every event is returned."""
+    if not cursor:
+        return events, False
+    fingerprints = [fingerprint(event) for event in events]
+    length = len(cursor)
+    # Latest match wins, so an entry repeated further back isn't mistaken for our place. Near the start of
+    # the window only the part of the cursor which fits is compared.
+    for end in range(len(fingerprints), 0, -1):
+        overlap = min(length, end)
+        if fingerprints[end - overlap : end] == cursor[length - overlap :]:
+            return events[end:], True
+    return events, False
+
+
+class LogState:
+    """Cursors of the incremental log commands, keyed by target and command. When given a path the
+    cursors are saved there after every change, so a restarted exporter only reads what is new."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.cursors = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as fh:
+                    self.cursors = json.load(fh)
+            except ValueError:
+                log.warning(f'Ignoring unreadable log state in {path}')
+
+    def get(self, key: str) -> list:
+        return self.cursors.get(key, [])
+
+    def set(self, key: str, cursor: list):
+        if self.cursors.get(key) == cursor:
+            return
+        self.cursors[key] = cursor
+        if self.path is None:
+            return
+        # Written to the side and renamed over the old file, so a crash can't leave it half-written
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as fh:
+            json.dump(self.cursors, fh, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+def state_for(path: str = None) -> LogState:
+    if path not in _states:
+        _states[path] = LogState(path)
+    return _states[path]
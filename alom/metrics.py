@@ -1,89 +1,463 @@
 import argparse
 import logging
+import os
+import signal
+import threading
 import time
+from collections import namedtuple
 
-from prometheus_client import start_http_server, Enum
-from prometheus_client.core import GaugeMetricFamily, REGISTRY
-
-from alom.parse import parse_showenvironment
-from alom.ssh import ALOMConnection
-from alom.exceptions import PartialResponseException
+from alom.commands import COMMANDS
+from alom.config import load_targets
+from alom.exposition import escape, floatToGoString, header, sample
+from alom.instrumentation import phase_duration
+from alom.poller import Poller
+from alom.pool import build_sessions
+from alom.server import start_exporter_server
+from alom.shard import ShardedPoller
+from alom.snapshot import Table, column_items
 
 log = logging.getLogger()
 
+# A metric family built from columns of a parsed table. A family with one column has one sample per row;
+# a family with several columns has one sample per row and column, with the column name in column_label.
+# Columns a row doesn't have (because the table differs between models) are skipped.
+Family = namedtuple('Family', ['name', 'documentation', 'columns', 'column_label'])
+# How each table of the parsed environment is exported: label holding the first column of each row, and families
+TableSchema = namedtuple('TableSchema', ['label', 'families'])
+
+TABLE_SCHEMAS = {
+    'temperature': TableSchema(
+        'sensor',
+        [
+            Family('alom_system_temperature', 'Current temperature of system sensors', ('Temp',), None),
+            Family('alom_system_temperature_status', 'Status of temperature sensors', ('Status',), None),
+            Family(
+                'alom_system_temperature_threshold',
+                'Temperature thresholds of system sensors',
+                ('LowHard', 'LowSoft', 'LowWarn', 'HighWarn', 'HighSoft', 'HighHard'),
+                'threshold',
+            ),
+        ],
+    ),
+    'fans': TableSchema(
+        'sensor',
+        [
+            Family('alom_fan_speed', 'Current speed of cooling fans in RPM', ('Speed',), None),
+            Family('alom_fan_status', 'Status of cooling fans', ('Status',), None),
+            Family('alom_fan_speed_threshold', 'Speed thresholds of cooling fans in RPM', ('Warn', 'Low'), 'threshold'),
+        ],
+    ),
+    'voltage': TableSchema(
+        'sensor',
+        [
+            Family('alom_voltage_status', 'Current voltage at sensors across the machine', ('Voltage',), None),
+            Family('alom_voltage_sensor_status', 'Status of voltage sensors', ('Status',), None),
+            Family(
+                'alom_voltage_threshold',
+                'Voltage thresholds of sensors across the machine',
+                ('LowSoft', 'LowWarn', 'HighWarn', 'HighSoft'),
+                'threshold',
+            ),
+        ],
+    ),
+    'load': TableSchema(
+        'sensor',
+        [
+            Family('alom_system_load', 'Current system load in amps', ('Load',), None),
+            Family('alom_system_load_status', 'Status of system load sensors', ('Status',), None),
+            Family('alom_system_load_threshold', 'System load thresholds in amps', ('Warn', 'Shutdown'), 'threshold'),
+        ],
+    ),
+    'current': TableSchema(
+        'sensor',
+        [Family('alom_sensor_status', 'Status of current sensors', ('Status',), None)],
+    ),
+    'psu': TableSchema(
+        'supply',
+        [
+            Family('alom_power_supply_status', 'Status of power supplies', ('Status',), None),
+            Family(
+                'alom_power_supply_fault',
+                'Fault flags of power supplies',
+                ('Underspeed', 'Overtemp', 'Overvolt', 'Undervolt', 'Overcurrent'),
+                'fault',
+            ),
+        ],
+    ),
+    'disk': TableSchema(
+        'disk',
+        [
+            Family('alom_disk_status', 'Status of disks, -1 for an empty slot', ('Status',), None),
+            Family('alom_disk_indicator', 'Service and OK to remove indicators of disks', ('Service', 'OK2RM'), 'indicator'),
+        ],
+    ),
+}
+
+# States an indicator LED can be in. alom_indicator_status has a sample for each of them per indicator, 1 for
+# the current state and 0 for the rest, like a prometheus_client Enum. A state missing here is added after them.
+INDICATOR_STATES = ('OFF', 'ON', 'SLOW BLINK', 'FAST BLINK', 'STANDBY BLINK')
+# Value of the disk Status column for an empty slot, see alom.parse.custom_table_values
+DISK_NOT_PRESENT = -1.0
+
+# Families summarizing the readings history of each sensor, see alom.history
+HISTORY_FAMILIES = [
+    ('alom_sensor_window_min', 'Lowest reading of each sensor over the history window'),
+    ('alom_sensor_window_max', 'Highest reading of each sensor over the history window'),
+    ('alom_sensor_window_avg', 'Mean reading of each sensor over the history window'),
+]
+
+# Families describing the exporter's view of each target, which change on every scrape
+STATUS_FAMILIES = {
+    'heartbeat': ('alom_ok', 'Scraping status from ALOM'),
+    'timestamp': ('alom_last_scrape_timestamp_seconds', 'Unix time of the last successful scrape of the ALOM'),
+    'snapshot_age': ('alom_snapshot_age_seconds', 'Age of the sensor data being served for the ALOM'),
+    'session_up': ('alom_session_up', 'Whether the SSH session to the ALOM is currently open'),
+    'session_age': ('alom_session_age_seconds', 'Time since the SSH session to the ALOM was opened'),
+}
+
+
+def render_family(target: str, label: str, family: Family, table: dict) -> bytes:
+    """Render every row of one parsed table as samples of one metric family"""
+    prefix = f'{family.name}{{target="{escape(target)}",{label}="'
+    if family.column_label is None:
+        lines = (
+            f'{prefix}{escape(sensor)}"}} {floatToGoString(value)}\n'
+            for sensor, value in column_items(table, family.columns[0])
+        )
+    elif isinstance(table, Table):
+        columns = [(column, table.column(column)) for column in family.columns if column in table.schema.index]
+        lines = (
+            f'{prefix}{escape(sensor)}",{family.column_label}="{column}"}} {floatToGoString(values[row])}\n'
+            for row, sensor in enumerate(table.names)
+            for column, values in columns
+        )
+    else:
+        lines = (
+            f'{prefix}{escape(sensor)}",{family.column_label}="{column}"}} {floatToGoString(readings[column])}\n'
+            for sensor, readings in table.items()
+            for column in family.columns
+            if column in readings
+        )
+    return ''.join(lines).encode('utf-8')
+
+
+def family_values(family: Family, table: dict) -> list:
+    """The values a family is rendered from, to tell whether it needs rendering again"""
+    if isinstance(table, Table):
+        # Whole columns at once, without looking up each row
+        columns = [table.column(column) for column in family.columns]
+        return [table.names] + [[None] * len(table) if values is None else values.tolist() for values in columns]
+    return [list(table)] + [[readings.get(column) for readings in table.values()] for column in family.columns]
+
+
+def render_power(target: str, data: dict) -> bytes:
+    return f'alom_system_power{{target="{escape(target)}"}} {floatToGoString(data["power"]["system"])}\n'.encode('utf-8')
+
+
+def render_indicator(target: str, indicator: str, state: str) -> bytes:
+    """Render the alom_indicator_status samples of one indicator in one state"""
+    prefix = f'alom_indicator_status{{target="{escape(target)}",indicator="{escape(indicator)}",alom_indicator_status="'
+    states = INDICATOR_STATES if state in INDICATOR_STATES else INDICATOR_STATES + (state,)
+    lines = (f'{prefix}{escape(name)}"}} {floatToGoString(name == state)}\n' for name in states)
+    return ''.join(lines).encode('utf-8')
+
+
+def render_disk_presence(target: str, table: dict) -> bytes:
+    prefix = f'alom_disk_present{{target="{escape(target)}",disk="'
+    lines = (
+        f'{prefix}{escape(disk)}"}} {floatToGoString(status != DISK_NOT_PRESENT)}\n'
+        for disk, status in column_items(table, 'Status')
+    )
+    return ''.join(lines).encode('utf-8')
+
+
+def render_history(target: str, summary: dict) -> list:
+    """Render a TargetHistory summary as one chunk of samples per family in HISTORY_FAMILIES"""
+    target = escape(target)
+    lines = [[] for _ in HISTORY_FAMILIES]
+    for (category, sensor), values in summary.items():
+        labels = f'{{target="{target}",category="{category}",sensor="{escape(sensor)}"}}'
+        for (name, _), family_lines, value in zip(HISTORY_FAMILIES, lines, values):
+            family_lines.append(f'{name}{labels} {floatToGoString(value)}\n')
+    return [''.join(family_lines).encode('utf-8') for family_lines in lines]
+
+
+class TargetExposition:
+    """Rendered samples for the last snapshot of one target, kept per metric family so a new snapshot
+    only re-renders the families whose values actually changed. Thresholds hardly ever change, so
+    they are rendered once and reused while the readings next to them move."""
+
+    __slots__ = ('snapshot', 'chunks', 'indicators')
+
+    def __init__(self):
+        self.snapshot = None
+        self.chunks = {}
+        # (indicator, state) -> rendered samples. Indicators only move between a few states, so after
+        # the first few polls a changed indicator table is rendered without building any strings.
+        self.indicators = {}
+
+    def update(self, target: str, snapshot, history=None):
+        if snapshot is self.snapshot:
+            return
+        if snapshot is None:
+            self.chunks = {}
+        else:
+            previous = self.snapshot.data if self.snapshot is not None else {}
+            data = snapshot.data
+            for category, schema in TABLE_SCHEMAS.items():
+                table = data.get(category, {})
+                old_table = previous.get(category, {})
+                if schema.families[0].name in self.chunks and (table is old_table or table == old_table):
+                    continue
+                for family in schema.families:
+                    if family.name in self.chunks and family_values(family, table) == family_values(family, old_table):
+                        continue
+                    self.chunks[family.name] = render_family(target, schema.label, family, table)
+            if 'power' not in self.chunks or data['power']['system'] != previous['power']['system']:
+                self.chunks['power'] = render_power(target, data)
+            indicators = data.get('indicator', {})
+            if 'alom_indicator_status' not in self.chunks or indicators != previous.get('indicator', {}):
+                self.chunks['alom_indicator_status'] = b''.join(
+                    self.indicator_samples(target, indicator, state) for indicator, state in indicators.items()
+                )
+            disks = data.get('disk', {})
+            old_disks = previous.get('disk', {})
+            if 'alom_disk_present' not in self.chunks or not (disks is old_disks or disks == old_disks):
+                self.chunks['alom_disk_present'] = render_disk_presence(target, disks)
+            # The summary is recorded before the snapshot is published, so it changes only along with the snapshot
+            if history is not None:
+                for (name, _), chunk in zip(HISTORY_FAMILIES, render_history(target, history.summary)):
+                    self.chunks[name] = chunk
+        self.snapshot = snapshot
+
+    def indicator_samples(self, target: str, indicator: str, state: str) -> bytes:
+        samples = self.indicators.get((indicator, state))
+        if samples is None:
+            samples = self.indicators[(indicator, state)] = render_indicator(target, indicator, state)
+        return samples
+
 
 class ALOMCollector:
-    def __init__(self, connection):
-        self.connection = connection
+    def __init__(self, pollers: dict, refresh=None):
+        """pollers maps target name -> TargetPoller. Collection only reads the pollers' latest snapshots,
+        so it never waits on an SSH round-trip. refresh(target, timeout) polls one target right away;
+        render_target() uses it when a probed target has no fresh snapshot.
+        """
+        self.pollers = pollers
+        self.refresh = refresh
+        self.targets = {}
+        # HTTP requests are served from several threads, and rendering updates the caches below
+        self._lock = threading.Lock()
+        # Family headers never change, so they are rendered once
+        self.sensor_headers = {
+            family.name: header(family.name, family.documentation)
+            for schema in TABLE_SCHEMAS.values()
+            for family in schema.families
+        }
+        self.sensor_headers['power'] = header('alom_system_power', 'System power status')
+        self.sensor_headers['alom_indicator_status'] = header('alom_indicator_status', 'State of system indicator LEDs')
+        self.sensor_headers['alom_disk_present'] = header('alom_disk_present', 'Whether each disk slot holds a disk')
+        self.sensor_headers.update((name, header(name, documentation)) for name, documentation in HISTORY_FAMILIES)
+        self.status_headers = {category: header(name, doc) for category, (name, doc) in STATUS_FAMILIES.items()}
+        # Sensor samples for every target, reused as-is until some target gets a new snapshot
+        self._body = b''
+        self._body_snapshots = ()
+        self._body_pollers = None
+        self.command_headers = {
+            name: header(name, documentation)
+            for command in COMMANDS.values()
+            for name, documentation in command.families.items()
+        }
+        self.command_headers['alom_command_last_success_timestamp_seconds'] = header(
+            'alom_command_last_success_timestamp_seconds', 'Unix time each additional command last succeeded'
+        )
+        # (target, command) -> (snapshot, rendered samples by family), so each output is rendered once
+        self._command_samples = {}
+
+    def render_sensors(self, pollers: dict, snapshots: list) -> bytes:
+        # A reload swaps in a new pollers mapping, which may hold different targets with the same snapshots
+        if (
+            pollers is self._body_pollers
+            and len(snapshots) == len(self._body_snapshots)
+            and all(a is b for a, b in zip(snapshots, self._body_snapshots))
+        ):
+            return self._body
+        for target in set(self.targets) - set(pollers):
+            del self.targets[target]
+        for key in [key for key in self._command_samples if key[0] not in pollers]:
+            del self._command_samples[key]
+        for (target, poller), snapshot in zip(pollers.items(), snapshots):
+            exposition = self.targets.setdefault(target, TargetExposition())
+            if snapshot is not exposition.snapshot:
+                started = time.monotonic()
+                exposition.update(target, snapshot, poller.history)
+                phase_duration.labels(target, 'render').observe(time.monotonic() - started)
+        expositions = [self.targets[target] for target in pollers]
+        parts = []
+        for family, family_header in self.sensor_headers.items():
+            parts.append(family_header)
+            parts.extend(exposition.chunks.get(family, b'') for exposition in expositions)
+        self._body = b''.join(parts)
+        self._body_snapshots = tuple(snapshots)
+        self._body_pollers = pollers
+        return self._body
 
-    def collect(self):
-        metrics = {}
-        metrics['temperature'] = GaugeMetricFamily(
-            'alom_system_temperature', 'Current temperature of system sensors', labels=['sensor']
+    def render_status(self, pollers: dict, snapshots: list, now: float) -> bytes:
+        lines = {category: [] for category in STATUS_FAMILIES}
+        for (target, poller), snapshot in zip(pollers.items(), snapshots):
+            label = f'{{target="{escape(target)}"}}'
+            # No usable snapshot means the target was never scraped, or the last good data is too old to be trusted
+            ok = 1 if snapshot is not None and poller.last_poll_ok else 0
+            lines['heartbeat'].append(f'alom_ok{label} {floatToGoString(ok)}\n')
+            if poller.snapshot is not None:
+                lines['timestamp'].append(
+                    f'alom_last_scrape_timestamp_seconds{label} {floatToGoString(poller.snapshot.timestamp)}\n'
+                )
+                lines['snapshot_age'].append(
+                    f'alom_snapshot_age_seconds{label} {floatToGoString(now - poller.snapshot.timestamp)}\n'
+                )
+            connected_at = poller.session.connected_at
+            lines['session_up'].append(f'alom_session_up{label} {floatToGoString(0 if connected_at is None else 1)}\n')
+            if connected_at is not None:
+                lines['session_age'].append(f'alom_session_age_seconds{label} {floatToGoString(now - connected_at)}\n')
+        return b''.join(
+            self.status_headers[category] + ''.join(lines[category]).encode('utf-8') for category in STATUS_FAMILIES
         )
-        # metrics['indicator'] = Enum(
-        #    'alom_indicator_status',
-        #    'Status of each indicator LED',
-        #    labelnames=['indicator'],
-        #    states=['OFF', 'FAST BLINK', 'STANDBY BLINK']
-        # )
-        metrics['fans'] = GaugeMetricFamily('alom_fan_speed', 'Current speed of cooling fans in RPM', labels=['sensor'])
-        metrics['voltage'] = GaugeMetricFamily(
-            'alom_voltage_status', 'Current voltage at sensors across the machine', labels=['sensor']
+
+    def command_samples(self, target: str, poller, now: float) -> dict:
+        snapshot = poller.current(now)
+        key = (target, poller.command.name)
+        cached = self._command_samples.get(key)
+        if cached is not None and cached[0] is snapshot:
+            return cached[1]
+        rendered = {}
+        if snapshot is not None:
+            for family, labels, value in poller.command.render(target, snapshot.data):
+                rendered[family] = rendered.get(family, '') + sample(family, labels, value)
+        self._command_samples[key] = (snapshot, rendered)
+        return rendered
+
+    def render_commands(self, pollers: dict, now: float) -> bytes:
+        """Render the output of every additional command configured on any target"""
+        lines = {family: [] for family in self.command_headers}
+        for target, target_poller in pollers.items():
+            for name, poller in target_poller.commands.items():
+                for family, text in self.command_samples(target, poller, now).items():
+                    lines[family].append(text)
+                if poller.snapshot is not None:
+                    lines['alom_command_last_success_timestamp_seconds'].append(
+                        sample(
+                            'alom_command_last_success_timestamp_seconds',
+                            [('target', target), ('command', name)],
+                            poller.snapshot.timestamp,
+                        )
+                    )
+        return b''.join(
+            self.command_headers[family] + ''.join(family_lines).encode('utf-8')
+            for family, family_lines in lines.items()
+            if family_lines
         )
-        metrics['load'] = GaugeMetricFamily('alom_system_load', 'Current system load in amps', labels=['sensor'])
-        metrics['current'] = GaugeMetricFamily('alom_sensor_status', 'Status of current sensors', labels=['sensor'])
-        metrics['psu'] = GaugeMetricFamily('alom_power_supply_status', 'Status of power supplies', labels=['supply'])
-        metrics['heartbeat'] = GaugeMetricFamily('alom_ok', 'Scraping status from ALOM')
-        metrics['power'] = GaugeMetricFamily('alom_system_power', 'System power status')
-        try:
-            env = self.connection.showenvironment()
-            trimmed = [line.strip() for line in env.splitlines()]
-            data = parse_showenvironment(trimmed)
-            metrics['heartbeat'].add_metric([], 1)
-        except PartialResponseException as e:
-            # A partially formed response causes the heartbeat metric to drop and the timer for returning data to increase
-            metrics['heartbeat'].add_metric([], 0)
-            self.connection.increase_backoff()
-            log.warning('Increasing command wait due to partially formed response')
-            yield metrics['heartbeat']
-        except Exception as e:
-            metrics['heartbeat'].add_metric([], 0)
-            raise  # Gradually this should become a logging statement so the daemon doesn't crash.
-        # Simple metrics
-        metrics['power'].add_metric([], data['power']['system'])
-        for sensor, sensor_readings in data['temperature'].items():
-            # XXX include sensor thresholds (Low/High Hard/Soft/Warn) if appropriate
-            metrics['temperature'].add_metric([sensor], sensor_readings['Temp'])
-        # for indicator, state in data['indicator'].items():
-        #    metrics['indicator'].labels(indicator).state(state)
-        for fan_sensor, fan_status in data['fans'].items():
-            metrics['fans'].add_metric([fan_sensor], fan_status['Speed'])
-        for sensor, sensor_readings in data['voltage'].items():
-            metrics['voltage'].add_metric([sensor], sensor_readings['Voltage'])
-        for sensor, sensor_readings in data['load'].items():
-            metrics['load'].add_metric([sensor], sensor_readings['Load'])
-        for sensor, sensor_readings in data['current'].items():
-            metrics['current'].add_metric([sensor], sensor_readings['Status'])
-        for sensor, sensor_readings in data['psu'].items():
-            metrics['psu'].add_metric([sensor], sensor_readings['Status'])
-        for metric in metrics.values():
-            yield metric
+
+    def render(self) -> bytes:
+        """Return the text exposition of every target's metrics"""
+        now = time.time()
+        # Read once, since a reload may replace it while rendering
+        pollers = self.pollers
+        snapshots = [poller.current(now) for poller in pollers.values()]
+        with self._lock:
+            return (
+                self.render_sensors(pollers, snapshots)
+                + self.render_status(pollers, snapshots, now)
+                + self.render_commands(pollers, now)
+            )
+
+    def render_target(self, target: str, timeout: float) -> bytes:
+        """Return the text exposition of one target's metrics, or None if there is no such target.
+        A target without a fresh snapshot is polled first, waiting at most timeout seconds."""
+        poller = self.pollers.get(target)
+        if poller is None:
+            return None
+        if poller.current() is None and self.refresh is not None:
+            self.refresh(target, timeout)
+        now = time.time()
+        snapshot = poller.current(now)
+        single = {target: poller}
+        with self._lock:
+            exposition = self.targets.setdefault(target, TargetExposition())
+            exposition.update(target, snapshot, poller.history)
+            sensors = b''.join(
+                family_header + exposition.chunks.get(family, b'') for family, family_header in self.sensor_headers.items()
+            )
+            return sensors + self.render_status(single, [snapshot], now) + self.render_commands(single, now)
+
+    def history(self, target: str, sensor: str) -> list:
+        """Return the readings history of one sensor of a target, see TargetHistory.series, or None if
+        there is no such target or it doesn't keep history"""
+        poller = self.pollers.get(target)
+        if poller is None or poller.history is None:
+            return None
+        return poller.history.series(sensor)
+
+
+def reload(config_path: str, poller, collector: ALOMCollector):
+    """Apply a changed configuration file without touching targets whose configuration is unchanged"""
+    try:
+        targets = load_targets(config_path)
+        # Worker processes build their own sessions from the configuration
+        update = targets if isinstance(poller, ShardedPoller) else build_sessions(targets)
+    except Exception:
+        log.exception(f'Not reloading, {config_path} could not be read')
+        return
+    try:
+        added, removed, changed = poller.reload(update)
+    except Exception:
+        log.exception(f'Not reloading, {config_path} could not be applied')
+        return
+    collector.pollers = poller.targets
+    log.info(f'Reloaded {config_path}: {len(added)} added, {len(removed)} removed, {len(changed)} changed')
 
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument('-c', '--config', help='Path to configuration file', default='config.yaml')
-    p.add_argument('--port', help='Port to bind', default=9897)
+    p.add_argument('--port', help='Port to bind', default=9897, type=int)
+    p.add_argument('-w', '--watch', help='Reload the configuration file when it changes', action='store_true')
+    p.add_argument(
+        '--workers', help='Split targets between this many worker processes (0 polls in-process)', default=0, type=int
+    )
     p.add_argument('-d', '--debug', help='Enable debug logging', action='store_true')
     args = p.parse_args()
     level = logging.DEBUG if args.debug else logging.INFO
     logging.basicConfig(level=level)
-    with ALOMConnection(args.config) as connection:
-        REGISTRY.register(ALOMCollector(connection))
-        start_http_server(args.port)
+    targets = load_targets(args.config)
+    if args.workers > 0:
+        poller = ShardedPoller(targets, args.workers, level)
+        log.info(f'Polling {len(targets)} targets in {args.workers} worker processes')
+    else:
+        poller = Poller(build_sessions(targets))
+        log.info(f'Polling {len(targets)} targets')
+    poller.start()
+    collector = ALOMCollector(poller.targets, poller.refresh)
+    start_exporter_server(args.port, collector)
+    # SIGHUP only sets a flag; the reload itself happens on the main thread below
+    hangup = threading.Event()
+    signal.signal(signal.SIGHUP, lambda signum, frame: hangup.set())
+    modified = os.stat(args.config).st_mtime
+    try:
         while True:
-            time.sleep(10)
+            time.sleep(1)
+            if args.watch:
+                try:
+                    previous, modified = modified, os.stat(args.config).st_mtime
+                except OSError:
+                    continue
+                if modified != previous:
+                    hangup.set()
+            if hangup.is_set():
+                hangup.clear()
+                reload(args.config, poller, collector)
+    finally:
+        poller.stop()
 
 
 if __name__ == '__main__':
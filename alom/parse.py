@@ -1,11 +1,11 @@
 #!/usr/bin/env python
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from typing import List
-import json
 import sys
 import re
 
 from alom.exceptions import PartialResponseException
+from alom.snapshot import Schema, Table, schema_for
 
 # Names from environmental report -> keys in result data / metric name fragments
 header_to_category = {
@@ -30,101 +30,213 @@ header_to_category = {
 custom_table_values = {
     'OFF': 0.0,
     'OK': 1.0,
+    'ON': 1.0,
     'NOT PRESENT': -1.0,
     '--': -1.0,
 }
 
+# Marker ending every table which is unavailable while the system is powered off
+POWER_OFF_MARKER = 'cannot be displayed when System power is off'
+
 
 def atoi(table_data: str) -> float:
     """Convert a value from environmental status table into numeric
     representation: a float for float values, 0/1 for binary values"""
+    # Status columns are mostly "OK"/"OFF", so check those before paying for a failed float()
+    value = custom_table_values.get(table_data)
+    if value is not None:
+        return value
     try:
         return float(table_data)
     except ValueError as e:
-        if table_data in custom_table_values:
-            return custom_table_values[table_data]
         raise Exception(f'Value {table_data} is currently unhandled by the ALOM parser') from e
 
 
-def parse_table(lines: List[str], start_index: int) -> (dict, int):
+class _ValueCache(dict):
+    """Memoizes atoi() per token. Thresholds and statuses repeat on every row and every poll, so almost every
+    lookup is a hit served without a Python-level function call. Bounded so fluctuating readings can't grow it forever."""
+
+    max_size = 8192
+
+    def __missing__(self, table_data: str) -> float:
+        value = atoi(table_data)
+        if len(self) < self.max_size:
+            self[table_data] = value
+        return value
+
+
+class _ByteValueCache(_ValueCache):
+    """The same for raw tokens, so a hit needs no decoding"""
+
+    def __missing__(self, table_data: bytes) -> float:
+        value = atoi(table_data.decode('utf-8'))
+        if len(self) < self.max_size:
+            self[table_data] = value
+        return value
+
+
+class _NameCache(dict):
+    """Decodes raw sensor names once. Interned, so every snapshot shares the same key objects."""
+
+    max_size = 8192
+
+    def __missing__(self, name: bytes) -> str:
+        text = sys.intern(name.decode('utf-8'))
+        if len(self) < self.max_size:
+            self[name] = text
+        return text
+
+
+def _byte_schema(columns: list) -> Schema:
+    return schema_for(column.decode('utf-8') for column in columns)
+
+
+def _decoded(value: bytes) -> str:
+    return value.decode('utf-8')
+
+
+def _unchanged(value: str) -> str:
+    return value
+
+
+# What the parser looks for in a response, and how it turns what it finds into results. There is one
+# vocabulary for lines of str and one for lines of bytes, so a raw response is parsed with the same code
+# without being decoded first.
+Vocabulary = namedtuple(
+    'Vocabulary',
+    [
+        'empty',  # a blank line
+        'space',
+        'colon',  # ends a table header
+        'divider',  # starts a divider line
+        'first',  # range of the first character of a column header line
+        'last',
+        'fans_header',  # the extra line before the T2000 fan table's column headers
+        'indicator_header',
+        'not_present',
+        'power_off',  # POWER_OFF_MARKER
+        'categories',  # header_to_category
+        'row_tokens',  # splits a row on whitespace, except within "NOT PRESENT"
+        'values',  # token -> float, see atoi()
+        'name',  # token -> interned sensor name
+        'schema',  # column header tokens -> Schema
+        'text',  # token -> str, for indicators
+    ],
+)
+
+_STR = Vocabulary(
+    '',
+    ' ',
+    ':',
+    '----',
+    'A',
+    'Z',
+    'Fans (Speeds Revolution Per Minute):',
+    'System Indicator Status',
+    'NOT PRESENT',
+    POWER_OFF_MARKER,
+    header_to_category,
+    re.compile(r'NOT PRESENT|\S+').findall,
+    _ValueCache().__getitem__,
+    sys.intern,
+    schema_for,
+    _unchanged,
+)
+_BYTES = Vocabulary(
+    *(value.encode('ascii') for value in _STR[:10]),
+    {header.encode('ascii'): category for header, category in header_to_category.items()},
+    re.compile(rb'NOT PRESENT|\S+').findall,
+    _ByteValueCache().__getitem__,
+    _NameCache().__getitem__,
+    _byte_schema,
+    _decoded,
+)
+
+
+def _is_capitalized(line: str, vocabulary: Vocabulary = _STR) -> bool:
+    # Equivalent to re.search('^[A-Z]', line) without the regex machinery
+    return line[:1] >= vocabulary.first and line[:1] <= vocabulary.last
+
+
+def parse_table(lines: List[str], start_index: int, vocabulary: Vocabulary = _STR) -> (Table, int):
     """Parse a full table from environmental status report, starting with the header.
-    Return the table as a nested mapping with the first column (sensor name) as the key for
-    each row's values. Also track & return the line count read to avoid double parsing.
+    Return the table as a Table mapping the first column (sensor name) to each row's values.
+    Also track & return the line count read to avoid double parsing.
 
     Parameters:
         lines: Full contents of environmental status
         start_index: Index of table header
+        vocabulary: _STR for lines of str, _BYTES for lines of bytes
     """
-    parsed = defaultdict(dict)
     # Find column header line: next line starting with a capital alphanum after start_index
     iterator = start_index + 1
-    line = lines[iterator]
-    while not re.search('^[A-Z]', line):
-        iterator += 1
-        line = lines[iterator]
-    if line == 'Fans (Speeds Revolution Per Minute):':
-        # The fans header on T2000 includes an extra line before the table header
-        iterator += 1
+    try:
         line = lines[iterator]
-    header = line.split()
+        while not _is_capitalized(line, vocabulary):
+            iterator += 1
+            line = lines[iterator]
+        if line == vocabulary.fans_header:
+            # The fans header on T2000 includes an extra line before the table header
+            iterator += 1
+            line = lines[iterator]
+    except IndexError as e:
+        # The response ended before the table's column headers
+        raise PartialResponseException() from e
+    # Skip first column which describes the (sensor/supply ID) key
+    parsed = Table(vocabulary.schema(line.split()[1:]))
+    append = parsed.append
+    width = len(parsed.schema.columns) + 1
+    empty, divider, power_off, not_present = vocabulary.empty, vocabulary.divider, vocabulary.power_off, vocabulary.not_present
+    name, values = vocabulary.name, vocabulary.values
     # There is always a divider line after the header, so we can skip that safely
     iterator += 2
-    while iterator < len(lines):
+    line_count = len(lines)
+    while iterator < line_count:
         line = lines[iterator]
-        if line == "" or line.startswith('----'):
+        if line == empty or line.startswith(divider):
             # This indicates the end of the table- a blank newline or in some cases a final divider
             break
-        if 'cannot be displayed when System power is off' in line:
+        # find() rather than "in": bytes.__contains__ first tries its argument as an integer, which makes it
+        # several times slower than str's, and these checks run on every row
+        if line.find(power_off) >= 0:
             # Status tables occasionally include some records when power is off.
             # These records are informative only for our purposes so are skipped.
             iterator += 1
             continue
-        data = line.split()
         # Using .split() is the most reliable method for most tables, as the headers do not always match up with the values.
         # However, for System Disks, this method results in the token "NOT PRESENT" being broken up.
-        for idx, element in enumerate(data):
-            if element == 'PRESENT' and data[idx - 1] == 'NOT':
-                data = data[0 : idx - 1] + ['NOT PRESENT'] + data[idx + 1 :]
-        # print(f'{header}\t{iterator}\n{data}')
-        for idx, hdr in enumerate(header):
-            # Skip first column which describes the (sensor/supply ID) key
-            if idx == 0:
-                continue
-            # Use first column as the key for this data
-            try:
-                parsed[data[0]][hdr] = atoi(data[idx])
-            except IndexError as e:
-                # partially formed message causes columns to be split
-                raise PartialResponseException() from e
+        data = vocabulary.row_tokens(line) if line.find(not_present) >= 0 else line.split()
+        if len(data) < width:
+            # partially formed message causes columns to be split
+            raise PartialResponseException()
+        # Use first column as the key for this data
+        append(name(data[0]), map(values, data[1:width]))
         iterator += 1
     return parsed, iterator
 
 
-def _parse_indicator_row(header_line: str, values_line: str) -> dict:
-    result = {}
+def _parse_indicator_row(header_line: str, values_line: str, vocabulary: Vocabulary = _STR) -> dict:
     # Column values can be separated by spaces so we need to find the start index of each column
-    indexes = []
-    for header in header_line.split():
-        indexes.append(header_line.index(header))
+    headers = header_line.split()
+    indexes = [header_line.index(header) for header in headers]
     # Manually space and trim each value with the indexes of the headers
     values = [
         values_line[0 : indexes[1]].strip(),
         values_line[indexes[1] : indexes[2]].strip(),
         values_line[indexes[2] :].strip(),
     ]
-    for idx, hdr in enumerate(header_line.split()):
-        result[hdr] = values[idx]
-    return result
+    text = vocabulary.text
+    return {text(header): text(value) for header, value in zip(headers, values)}
 
 
-def parse_system_indicator_status(lines: List[str], start_index: int) -> (dict, int):
+def parse_system_indicator_status(lines: List[str], start_index: int, vocabulary: Vocabulary = _STR) -> (dict, int):
     """Parse a "System Indicator Status" table into a dict mapping indicator IDs to states.
     Return the new index of the iterator along with the resulting data.
     """
     iterator = start_index + 2  # Skip table header and first divider
     # First table always exists, and in some cases there are additional tables
     try:
-        result = _parse_indicator_row(lines[iterator], lines[iterator + 1])
+        result = _parse_indicator_row(lines[iterator], lines[iterator + 1], vocabulary)
     except IndexError as e:
         # similar to above, this occurs when the daemon didn't recieve a full response body back from the ALOM
         # processor. we need to flag this so we can increase the wait time
@@ -132,45 +244,60 @@ def parse_system_indicator_status(lines: List[str], start_index: int) -> (dict,
     iterator += 2  # Skip first table
     while iterator < len(lines):
         # An empty line means we've hit the end of this table
-        if lines[iterator] == '' or lines[iterator + 1] == '':
+        if lines[iterator] == vocabulary.empty or lines[iterator + 1] == vocabulary.empty:
             break
         # A divider followed by a capital letter in first position means we've found another row
-        if lines[iterator].startswith('----') and re.search('^[A-Z]', lines[iterator + 1]):
+        if lines[iterator].startswith(vocabulary.divider) and _is_capitalized(lines[iterator + 1], vocabulary):
             iterator += 1
             # Merge in additional rows
-            next_row = _parse_indicator_row(lines[iterator], lines[iterator + 1])
-            for k, v in next_row.items():
-                result[k] = v
+            result.update(_parse_indicator_row(lines[iterator], lines[iterator + 1], vocabulary))
             iterator += 2  # Skip this table
+        else:
+            # Anything else isn't part of this table
+            break
     return result, iterator
 
 
-def parse_showenvironment(lines: List[str]) -> dict:
+def parse_showenvironment(lines: List[str], vocabulary: Vocabulary = _STR) -> dict:
+    """Parse the stripped lines of a "showenvironment" response in a single pass.
+    Return a mapping of category (see header_to_category) -> table, plus a "power" category recording
+    whether the system and each category were powered on. Tables are alom.snapshot.Table objects, which
+    read like dicts mapping sensor name -> column -> value.
+    """
     result = defaultdict(dict)
-    result['power']['system'] = 1  # Assume power on until we hit a "System power is off" line
+    power = result['power']
+    power['system'] = 1  # Assume power on until we hit a "System power is off" line
 
+    categories = vocabulary.categories
     iterator = 0
-    while iterator < len(lines):
+    line_count = len(lines)
+    while iterator < line_count:
         line = lines[iterator]
-        if re.search(':$', line):
-            header = line.rstrip(':')
-            # print(f'Header: {header}')
+        if line.endswith(vocabulary.colon):
+            header = line[:-1]
             # Special case- several boolean columns with no divider
-            if header == 'System Indicator Status':
-                indicators, new_index = parse_system_indicator_status(lines, iterator)
-                result['indicator'] = indicators
-                iterator = new_index
+            if header == vocabulary.indicator_header:
+                result['indicator'], iterator = parse_system_indicator_status(lines, iterator, vocabulary)
                 continue
             # The rest are all proper tables
-            table, new_index = parse_table(lines, iterator)
-            result[header_to_category[header]] = table
-            result['power'][header_to_category[header]] = 1
-            iterator = new_index  # This is the end of the table and should still be incremented below
-        elif 'cannot be displayed when System power is off' in line:
-            result['power']['system'] = 0
-            header = ' '.join(line.split()[:3])
-            result['power'][header_to_category[header]] = 0
+            category = categories[header]
+            result[category], iterator = parse_table(lines, iterator, vocabulary)
+            power[category] = 1
+            # iterator is now the end of the table and should still be incremented below
+        elif line.find(vocabulary.power_off) >= 0:
+            power['system'] = 0
+            header = vocabulary.space.join(line.split()[:3])
+            power[categories[header]] = 0
         iterator += 1
 
-    # print(json.dumps(result, indent=2))
     return result
+
+
+def parse_showenvironment_bytes(buf: bytes) -> dict:
+    """Parse a raw "showenvironment" response, as read from the channel, without decoding it. The response is
+    split into lines of bytes and read by parse_showenvironment, which decodes only the sensor names and
+    column headers it keeps, each once per process, and converts values through a cache keyed by raw token."""
+    if not isinstance(buf, bytes):
+        # A memoryview has no splitlines(), and the lines of a bytearray can't be used as cache keys
+        buf = bytes(buf)
+    return parse_showenvironment([line.strip() for line in buf.splitlines()], _BYTES)
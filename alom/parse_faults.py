@@ -0,0 +1,34 @@
+from typing import List
+
+# Printed instead of the fault table when nothing is wrong
+NO_FAULTS_MARKER = 'No failures found'
+
+
+def parse_showfaults(lines: List[str]) -> List[dict]:
+    """Parse the stripped lines of a "showfaults" response into a list of faults, each a dict with the
+    fault "id", the "fru" it was reported against and its "fault" description. "showfaults -v" adds a
+    "time" to each fault. An empty list means the controller reported no faults.
+    """
+    faults = []
+    columns = None
+    for line in lines:
+        if NO_FAULTS_MARKER in line:
+            return []
+        if columns is None:
+            # Everything before the table header is the POST summary
+            if line.startswith('ID ') and 'FRU' in line:
+                columns = line.split()
+            continue
+        if line == '':
+            break
+        tokens = line.split()
+        fault = {'id': int(tokens[0])}
+        rest = tokens[1:]
+        if 'Time' in columns:
+            # Timestamps are printed as "MON DD HH:MM:SS"
+            fault['time'] = ' '.join(rest[:3])
+            rest = rest[3:]
+        fault['fru'] = rest[0]
+        fault['fault'] = ' '.join(rest[1:])
+        faults.append(fault)
+    return faults
@@ -0,0 +1,40 @@
+import re
+from typing import List
+
+# ALOM CMT: Feb 13 09:22:24: Chassis |major   : "Host has been powered on"
+_cmt_entry = re.compile(
+    r'^(?P<time>\w{3} +\d{1,2} \d{2}:\d{2}:\d{2}): (?P<source>\S+) *\|(?P<severity>\w+) *: "?(?P<message>.*?)"?$'
+)
+# ALOM: MAR 09 16:54:27 wgs40-58: 00060003: "SC System booted."
+_alom_entry = re.compile(
+    r'^(?P<time>\w{3} +\d{1,2} \d{2}:\d{2}:\d{2}) (?P<source>\S+): (?P<code>[0-9A-Fa-f]{8}): "?(?P<message>.*?)"?$'
+)
+
+
+def parse_showlogs(lines: List[str]) -> List[dict]:
+    """Parse the stripped lines of a "showlogs" response into a list of events, oldest first.
+    Each event is a dict with its "time" as printed, "source", "severity" and "message". Older ALOM
+    firmware prints an event code instead of a severity; those events have severity "unknown" and a "code".
+    Lines which aren't events, like the "Searching for the last 10 events..." banner, are skipped.
+    """
+    events = []
+    for line in lines:
+        match = _cmt_entry.match(line)
+        if match is not None:
+            event = match.groupdict()
+            event['severity'] = event['severity'].lower()
+        else:
+            match = _alom_entry.match(line)
+            if match is None:
+                continue
+            event = match.groupdict()
+            event['severity'] = 'unknown'
+        events.append(event)
+    return events
+
+
+def parse_consolehistory(lines: List[str]) -> List[dict]:
+    """Parse the stripped lines of a "consolehistory" response into events shaped like those of parse_showlogs.
+    The host console has no timestamps or severities, so each non-empty line is an "info" event from "console".
+    """
+    return [{'time': '', 'source': 'console', 'severity': 'info', 'message': line} for line in lines if line]
@@ -0,0 +1,29 @@
+from typing import List
+
+SERIAL_PREFIX = 'Chassis Serial Number:'
+
+
+def parse_showplatform(lines: List[str]) -> dict:
+    """Parse the stripped lines of a "showplatform" response.
+    Return the platform "model", the chassis "serial" number and a mapping of "domains" -> domain status.
+    """
+    result = {'model': '', 'serial': '', 'domains': {}}
+    iterator = 0
+    line_count = len(lines)
+    while iterator < line_count:
+        line = lines[iterator]
+        if line.startswith(SERIAL_PREFIX):
+            result['serial'] = line[len(SERIAL_PREFIX) :].strip()
+        elif line.split() == ['Domain', 'Status']:
+            # Skip the divider under the header; the table ends at the next blank line
+            iterator += 2
+            while iterator < line_count and lines[iterator] != '':
+                domain, _, status = lines[iterator].partition(' ')
+                result['domains'][domain] = status.strip()
+                iterator += 1
+            continue
+        elif line and not result['model']:
+            # The model name is printed on its own before anything else
+            result['model'] = line
+        iterator += 1
+    return result
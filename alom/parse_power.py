@@ -0,0 +1,37 @@
+from typing import List
+
+from alom.exceptions import PartialResponseException
+from alom.parse import atoi
+
+
+def _watts(tokens: List[str]) -> List[float]:
+    # Power readings are the numbers printed with a "W" unit after them
+    return [atoi(token) for token, unit in zip(tokens, tokens[1:]) if unit == 'W']
+
+
+def parse_showpower(lines: List[str]) -> dict:
+    """Parse the stripped lines of a "showpower" response.
+    Return a mapping of "supplies" -> supply name -> {"Status", "InputPower", "OutputPower"} in watts,
+    and the "total" input and output power across all supplies.
+    """
+    result = {'supplies': {}, 'total': {}}
+    in_table = False
+    for line in lines:
+        if line.startswith('Supply'):
+            in_table = True
+            continue
+        if line.startswith('Total Power'):
+            watts = _watts(line.split())
+            if len(watts) < 2:
+                raise PartialResponseException()
+            result['total'] = {'InputPower': watts[0], 'OutputPower': watts[1]}
+            in_table = False
+            continue
+        if not in_table or line == '' or line.startswith('----'):
+            continue
+        tokens = line.split()
+        watts = _watts(tokens)
+        if len(watts) < 2:
+            raise PartialResponseException()
+        result['supplies'][tokens[0]] = {'Status': atoi(tokens[1]), 'InputPower': watts[0], 'OutputPower': watts[1]}
+    return result
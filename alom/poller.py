@@ -0,0 +1,329 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from alom.commands import COMMANDS, Command
+from alom.diff import diff
+from alom.events import sink_for, webhook_for
+from alom.history import history_for
+from alom.instrumentation import environment_changes, log_events, partial_responses, phase_duration
+from alom.logs import cursor_after, cursor_key, state_for, unseen
+from alom.parse import parse_showenvironment_bytes
+from alom.exceptions import PartialResponseException
+
+log = logging.getLogger(__name__)
+
+# Parsed command output along with the wall clock time it was received
+Snapshot = namedtuple('Snapshot', ['data', 'timestamp'])
+
+
+def fresh(snapshot, max_age: float, now: float = None):
+    """Return the snapshot, or None if it is missing or older than max_age seconds"""
+    now = time.time() if now is None else now
+    if snapshot is None or now - snapshot.timestamp > max_age:
+        return None
+    return snapshot
+
+
+async def poll_forever(poll, interval: float, retry_delay: float):
+    """Call poll every interval seconds. After a failed poll, retry after retry_delay seconds instead, doubling
+    on each further failure until it reaches the interval. Meanwhile the last good snapshot keeps being served,
+    and the retry reads with the backoff the failure increased."""
+    delay = interval
+    while True:
+        started = time.monotonic()
+        if await poll():
+            delay = interval
+        else:
+            delay = min(retry_delay, interval) if delay >= interval else min(delay * 2, interval)
+        await asyncio.sleep(max(delay - (time.monotonic() - started), 0))
+
+
+async def scrape(session):
+    """Fetch and parse environmental status from one controller.
+    Return the parsed data, or None if the response was partial or the request failed.
+    """
+    try:
+        env = await session.showenvironment()
+        started = time.monotonic()
+        data = parse_showenvironment_bytes(env)
+        phase_duration.labels(session.name, 'parse').observe(time.monotonic() - started)
+        return data
+    except PartialResponseException:
+        # A partially formed response causes the heartbeat metric to drop and the timer for returning data to increase
+        partial_responses.labels(session.name).inc()
+        session.increase_backoff()
+        log.warning(f'Increasing command wait for {session.name} due to partially formed response')
+    except Exception:
+        # One broken controller shouldn't take down the scrape of the rest of the fleet
+        log.exception(f'Failed to collect environment from {session.name}')
+    return None
+
+
+async def scrape_command(session, command: Command, line: str = None):
+    """Run one of the commands in alom.commands, with the options in line if given, and parse its output.
+    Return the parsed data, or None if the response was partial or the request failed.
+    """
+    try:
+        response = await session.run_command(line or command.name)
+        started = time.monotonic()
+        data = command.parse([line.strip() for line in response.splitlines()])
+        phase_duration.labels(session.name, 'parse').observe(time.monotonic() - started)
+        return data
+    except PartialResponseException:
+        partial_responses.labels(session.name).inc()
+        session.increase_backoff()
+        log.warning(f'Increasing command wait for {session.name} due to partially formed {command.name} response')
+    except Exception:
+        log.exception(f'Failed to collect {command.name} from {session.name}')
+    return None
+
+
+class CommandPoller:
+    """CommandPoller refreshes the output of one additional command on its own interval, sharing the
+    target's session. The parsed output is kept like the environment snapshot, and is dropped once it is
+    older than three intervals.
+    """
+
+    def __init__(self, session, command: Command, interval: float = None):
+        self.session = session
+        self.command = command
+        self.interval = command.interval if interval is None else interval
+        self.max_age = self.interval * 3
+        self.snapshot = None
+        self.last_poll_ok = False
+
+    async def poll(self) -> bool:
+        data = await scrape_command(self.session, self.command)
+        if data is not None:
+            self.snapshot = Snapshot(data, time.time())
+        self.last_poll_ok = data is not None
+        return self.last_poll_ok
+
+    def current(self, now: float = None):
+        return fresh(self.snapshot, self.max_age, now)
+
+    async def run(self):
+        await poll_forever(self.poll, self.interval, self.session.config['retry_delay'])
+
+
+class LogPoller(CommandPoller):
+    """LogPoller reads a log command incrementally. It asks for only the last few lines, and doubles the
+    request until it finds the last entry it saw before, so each poll transfers roughly what was added
+    since the previous one instead of the whole log. New entries are counted in alom_log_events_total and
+    written to the JSON lines sink if one is configured. The snapshot holds the entries of the last poll.
+    """
+
+    def __init__(self, session, command: Command, interval: float = None):
+        super().__init__(session, command, interval)
+        config = session.config
+        self.min_window = config['log_window']
+        self.max_window = config['max_log_window']
+        self.key = cursor_key(session.name, command.name)
+        self.state = state_for(config.get('log_state_path'))
+        self.sink = sink_for(config['log_events_path']) if config.get('log_events_path') else None
+
+    async def read(self) -> list:
+        """Return the entries added since the cursor, or None if the command failed"""
+        cursor = self.state.get(self.key)
+        window = self.min_window
+        previous = -1
+        while True:
+            events = await scrape_command(self.session, self.command, f'{self.command.name} -e {window}')
+            if events is None:
+                return None
+            new, found = unseen(events, cursor)
+            # Stop once the cursor turns up, there is nothing older to ask for, or asking for more would cost too much
+            if not cursor or found or len(events) <= previous or window >= self.max_window:
+                break
+            previous = len(events)
+            window = min(window * 2, self.max_window)
+        if cursor and not found:
+            if window >= self.max_window and len(events) > previous:
+                log.warning(f'More than {window} lines of {self.command.name} on {self.session.name} since the last poll')
+            else:
+                log.info(f'{self.command.name} on {self.session.name} was cleared, reading it from the start')
+        if events:
+            self.state.set(self.key, cursor_after(events))
+        return new
+
+    async def poll(self) -> bool:
+        new = await self.read()
+        if new is not None:
+            for event in new:
+                log_events.labels(self.session.name, self.command.name, event['severity'], event['source']).inc()
+                if self.sink is not None:
+                    self.sink.write(dict(event, target=self.session.name, command=self.command.name))
+            self.snapshot = Snapshot(new, time.time())
+        self.last_poll_ok = new is not None
+        return self.last_poll_ok
+
+
+def check_commands(name: str, config: dict):
+    """Raise if a target's configuration asks for a command which doesn't exist"""
+    for command in config.get('commands', {}):
+        if command not in COMMANDS:
+            raise Exception(f'Unknown command {command} configured for {name}')
+
+
+class TargetPoller:
+    """TargetPoller refreshes the environmental status of one controller on a fixed interval in the background,
+    so metric collection only has to read the latest snapshot instead of waiting on the SSH round-trip.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.interval = session.config['poll_interval']
+        self.max_age = session.config['max_snapshot_age']
+        # Replaced wholesale after each successful poll, so readers never see a half-updated snapshot
+        self.snapshot = None
+        self.last_poll_ok = False
+        self.history = history_for(session.config)
+        # Where changes between consecutive snapshots are sent, besides alom_environment_changes_total
+        self.sinks = []
+        if session.config.get('change_events_path'):
+            self.sinks.append(sink_for(session.config['change_events_path']))
+        if session.config.get('change_webhook_url'):
+            self.sinks.append(webhook_for(session.config['change_webhook_url']))
+        # Every other configured command is polled on its own schedule over the same session
+        check_commands(session.name, session.config)
+        self.commands = {}
+        for name, interval in session.config.get('commands', {}).items():
+            command = COMMANDS[name]
+            poller = LogPoller if command.incremental else CommandPoller
+            self.commands[name] = poller(session, command, interval)
+        self._tasks = []
+
+    async def poll(self) -> bool:
+        data = await scrape(self.session)
+        if data is not None:
+            snapshot = Snapshot(data, time.time())
+            if self.history is not None:
+                self.history.record(snapshot)
+            if self.snapshot is not None:
+                self.report_changes(self.snapshot, snapshot)
+            self.snapshot = snapshot
+        self.last_poll_ok = data is not None
+        return self.last_poll_ok
+
+    def report_changes(self, previous: Snapshot, snapshot: Snapshot):
+        """Count and send on the changes since the previous good snapshot, so consumers can react within a poll"""
+        for change in diff(previous.data, snapshot.data):
+            log.debug(f'{self.session.name}: {change.category} {change.item} {change.field or ""} {change.old} -> {change.new}')
+            environment_changes.labels(self.session.name, change.category).inc()
+            if self.sinks:
+                record = dict(change._asdict(), target=self.session.name, timestamp=snapshot.timestamp)
+                for sink in self.sinks:
+                    sink.write(record)
+
+    def current(self, now: float = None):
+        """Return the latest snapshot, or None if there isn't one younger than the configured max age"""
+        return fresh(self.snapshot, self.max_age, now)
+
+    async def run(self):
+        # The session reconnects by itself in the background, so polling carries on regardless
+        await self.session.open()
+        loop = asyncio.get_running_loop()
+        for command in self.commands.values():
+            self._tasks.append(loop.create_task(command.run()))
+        await poll_forever(self.poll, self.interval, self.session.config['retry_delay'])
+
+    def start(self, loop):
+        self._tasks.append(loop.create_task(self.run()))
+
+    def stop(self):
+        """Stop polling and close the session. Must be called from the poller's event loop."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.session.close()
+
+
+class Poller:
+    """Poller runs every TargetPoller on a single asyncio event loop in a background thread.
+    The targets mapping is never modified in place: reload() swaps in a new mapping, so readers on
+    other threads can iterate over the one they hold without locking.
+    """
+
+    def __init__(self, sessions: dict):
+        self.targets = {name: TargetPoller(session) for name, session in sessions.items()}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='alom-poller', daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        # Only the blocking SSH handshake runs on these threads; reads are driven by the event loop
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=min(max(len(self.targets), 1), 64)))
+        for target in self.targets.values():
+            target.start(self.loop)
+        self.loop.run_forever()
+
+    def _reload(self, sessions: dict) -> (list, list, list):
+        targets = {}
+        added, removed, changed = [], [], []
+        for name, session in sessions.items():
+            running = self.targets.get(name)
+            if running is not None and running.session.config == session.config:
+                # Unchanged: keep the warm session and its last snapshot
+                targets[name] = running
+                continue
+            (changed if running is not None else added).append(name)
+            # Built before anything is stopped, so a configuration which fails here leaves every target running
+            targets[name] = TargetPoller(session)
+        for name, running in self.targets.items():
+            if name not in sessions:
+                running.stop()
+                removed.append(name)
+            elif name in changed:
+                running.stop()
+        for name in added + changed:
+            targets[name].start(self.loop)
+        self.targets = targets
+        return added, removed, changed
+
+    def refresh(self, name: str, timeout: float) -> bool:
+        """Poll one target now, from any thread, waiting at most timeout seconds for the result.
+        Return whether the poll succeeded; one which times out carries on in the background."""
+        target = self.targets.get(name)
+        if target is None:
+            return False
+        future = asyncio.run_coroutine_threadsafe(target.poll(), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            return False
+
+    def reload(self, sessions: dict) -> (list, list, list):
+        """Replace the running targets with sessions, a mapping of target name -> unopened session.
+        Targets whose configuration is unchanged keep polling on their existing session; only new and
+        changed targets connect. Return the names of the added, removed and changed targets.
+        If a new target can't be built, its exception is raised and the running targets are left as they were.
+        Called from other threads once the poller has started.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._async_reload(sessions), self.loop)
+        return future.result()
+
+    async def _async_reload(self, sessions: dict):
+        return self._reload(sessions)
+
+    def start(self):
+        self._thread.start()
+
+    async def _shutdown(self):
+        for target in self.targets.values():
+            target.stop()
+        # Sessions' maintenance tasks and commands still in flight
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        # Cancel everything before stopping the loop, so no task is left pending when it is closed
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
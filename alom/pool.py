@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import random
+import time
+
+from alom.aio import AsyncALOMSession
+from alom.config import with_defaults
+from alom.ssh import ALOMConnection
+from alom.exceptions import PartialResponseException
+from alom.instrumentation import session_reconnects
+from alom.scheduler import CommandScheduler
+
+log = logging.getLogger(__name__)
+
+
+def jittered(delay: float) -> float:
+    """Spread reconnects from many exporters (or many targets behind one failed switch) over half the delay"""
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class ManagedSession:
+    """ManagedSession keeps one AsyncALOMSession warm for the life of the exporter. Idle sessions get a
+    keepalive so the ALOM doesn't time them out, and a session which dies is reopened in the background
+    with jittered exponential backoff, so polls never wait on the multi-second login.
+    Commands fail fast with ConnectionError while the session is down.
+    """
+
+    def __init__(self, session: AsyncALOMSession):
+        self.session = session
+        self.name = session.name
+        self.config = session.config
+        self.connected_at = None
+        self.last_used = 0.0
+        # Serializes everything sent on the channel, keepalives included
+        self.scheduler = CommandScheduler(self.name, self.config['min_command_gap'])
+        # Created in open() so they belong to the poller's event loop
+        self._dead = None
+        self._connected = None
+        self._task = None
+
+    @property
+    def up(self) -> bool:
+        return self.connected_at is not None
+
+    def increase_backoff(self):
+        return self.session.increase_backoff()
+
+    async def open(self):
+        """Start maintaining the session and wait for the first connection attempt to finish"""
+        self._dead = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self.maintain())
+        await self._connected.wait()
+        return self
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.session.close()
+
+    async def _connect(self) -> bool:
+        try:
+            await self.session.open()
+        except Exception:
+            log.exception(f'Could not connect to {self.name}')
+            return False
+        self.connected_at = time.time()
+        self.last_used = time.monotonic()
+        self._dead.clear()
+        return True
+
+    def _mark_dead(self):
+        if self.connected_at is not None:
+            log.warning(f'Session to {self.name} died after {time.time() - self.connected_at:.0f}s')
+        self.connected_at = None
+        self._dead.set()
+
+    async def maintain(self):
+        delay = self.config['reconnect_min_delay']
+        first = True
+        while True:
+            if not self.up:
+                if not first:
+                    session_reconnects.labels(self.name).inc()
+                    self.session.close()
+                connected = await self._connect()
+                self._connected.set()
+                first = False
+                if not connected:
+                    wait = jittered(delay)
+                    log.info(f'Retrying connection to {self.name} in {wait:.1f}s')
+                    await asyncio.sleep(wait)
+                    delay = min(delay * 2, self.config['reconnect_max_delay'])
+                    continue
+                delay = self.config['reconnect_min_delay']
+            # Wake up early if a command finds the session dead
+            interval = self.config['keepalive_interval']
+            try:
+                await asyncio.wait_for(self._dead.wait(), interval)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - self.last_used >= interval:
+                try:
+                    await self.scheduler.run('keepalive', self.session.keepalive)
+                    self.last_used = time.monotonic()
+                except Exception:
+                    log.warning(f'Keepalive to {self.name} failed')
+                    self._mark_dead()
+
+    async def _run(self, key: str, command):
+        if not self.up:
+            raise ConnectionError(f'Session to {self.name} is down, waiting to reconnect')
+        return await self.scheduler.run(key, lambda: self._checked(command))
+
+    async def _checked(self, command):
+        try:
+            result = await command()
+        except PartialResponseException:
+            raise
+        except Exception:
+            self._mark_dead()
+            raise
+        if not self.session.alive:
+            self._mark_dead()
+        self.last_used = time.monotonic()
+        return result
+
+    async def showenvironment(self) -> bytes:
+        return await self._run('showenvironment', self.session.showenvironment)
+
+    async def run_command(self, command: str) -> str:
+        return await self._run(command, lambda: self.session.run_command(command))
+
+
+def build_sessions(targets: dict) -> dict:
+    """Create an unopened ManagedSession for each target in a mapping of target name -> configuration"""
+    return {
+        name: ManagedSession(AsyncALOMSession(ALOMConnection(config=with_defaults(config), name=name)))
+        for name, config in targets.items()
+    }
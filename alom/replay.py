@@ -0,0 +1,289 @@
+"""Record raw ALOM sessions and replay them through a local fake ALOM SSH server.
+
+A recording is a JSON lines file with one event per channel read or write, made by setting
+record_path in a target's configuration:
+
+    {"t": 0.412, "dir": "recv", "data": "Please login: "}
+    {"t": 0.415, "dir": "send", "data": "exporter\\n"}
+
+Data is stored as latin-1 text so every byte survives the round trip. Whatever is typed at a password
+prompt is recorded as REDACTED. The fake server answers each line the client sends with the chunks
+recorded after the same line, at the recorded pace.
+"""
+import argparse
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from collections import namedtuple
+
+import paramiko
+
+log = logging.getLogger(__name__)
+
+# Recorded in place of anything typed at a password prompt
+REDACTED = '<redacted>'
+PASSWORD_PROMPT = b'password:'
+
+# A line the client sent and the chunks the controller answered with, as (seconds after the line, bytes) pairs
+Exchange = namedtuple('Exchange', ['line', 'chunks'])
+
+
+class RecordingChannel:
+    """Wraps a paramiko channel, appending everything sent and received to a recording"""
+
+    def __init__(self, channel, path: str):
+        self._channel = channel
+        self._file = open(path, 'a')
+        self._started = time.monotonic()
+        # The tail of what was received since the last send, long enough to find a prompt split across reads
+        self._received = b''
+        self._at_password_prompt = False
+
+    def _record(self, direction: str, data: bytes):
+        event = {'t': round(time.monotonic() - self._started, 4), 'dir': direction, 'data': data.decode('latin-1')}
+        self._file.write(json.dumps(event) + '\n')
+        self._file.flush()
+
+    def send(self, data):
+        sent = self._channel.send(data)
+        if self._at_password_prompt:
+            self._record('send', REDACTED.encode('latin-1') + b'\n')
+        else:
+            self._record('send', (data.encode('utf-8') if isinstance(data, str) else data)[:sent])
+        # Whatever follows a password prompt is redacted until the next send, however the prompt arrived
+        self._at_password_prompt = False
+        self._received = b''
+        return sent
+
+    def recv(self, nbytes):
+        data = self._channel.recv(nbytes)
+        if data:
+            self._record('recv', data)
+            self._received = (self._received + data)[-64:]
+            if PASSWORD_PROMPT in self._received:
+                self._at_password_prompt = True
+        return data
+
+    def close(self):
+        self._file.close()
+        self._channel.close()
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+class ReplaySession:
+    """What a fake controller says: a banner sent on connect, then an answer to each line the client sends"""
+
+    def __init__(self, banner: list, exchanges: list):
+        self.banner = banner
+        self.exchanges = exchanges
+
+    @classmethod
+    def load(cls, path: str):
+        """Build a session from a recording made with record_path"""
+        banner = []
+        exchanges = []
+        sent_at = 0.0
+        with open(path, 'r') as fh:
+            for line in fh:
+                event = json.loads(line)
+                data = event['data'].encode('latin-1')
+                if event['dir'] == 'send':
+                    sent_at = event['t']
+                    exchanges.append(Exchange(data.decode('utf-8', 'replace').strip(), []))
+                elif exchanges:
+                    exchanges[-1].chunks.append((event['t'] - sent_at, data))
+                else:
+                    banner.append((event['t'], data))
+        return cls(banner, exchanges)
+
+    @classmethod
+    def synthesize(
+        cls, environment: str, username: str, password: str, delay: float = 0.0, chunk_size: int = 1024
+    ):
+        """Build a session from saved "showenvironment" output, like the samples in test/.
+        The response is split into chunks spread evenly over delay seconds."""
+        body = b'showenvironment\r\n' + '\r\n'.join(environment.splitlines()).encode('utf-8') + b'\r\nsc> '
+        count = max((len(body) + chunk_size - 1) // chunk_size, 1)
+        chunks = [(delay * (idx + 1) / count, body[idx * chunk_size : (idx + 1) * chunk_size]) for idx in range(count)]
+        exchanges = [
+            Exchange(username, [(0.0, username.encode('utf-8') + b'\r\nPlease Enter password: ')]),
+            Exchange(password, [(0.0, b'\r\n\r\nSun(tm) Advanced Lights Out Manager CMT v1.3\r\n\r\nsc> ')]),
+            Exchange('showenvironment', chunks),
+        ]
+        return cls([(0.0, b'Please login: ')], exchanges)
+
+    def answer(self, line: str, position: int) -> (list, int):
+        """Return the chunks answering line, and the position of the next unplayed exchange.
+        Exchanges are played in order while the client follows the recording (the login), after that
+        a line gets the most recent answer recorded for it."""
+        if position < len(self.exchanges) and self.exchanges[position].line in (line, REDACTED):
+            return self.exchanges[position].chunks, position + 1
+        for exchange in reversed(self.exchanges):
+            if exchange.line == line:
+                return exchange.chunks, position
+        echo = line.encode('utf-8') + b'\r\n'
+        if line == '':
+            return [(0.0, echo + b'sc> ')], position
+        return [(0.0, echo + b'Invalid command. Type \'help\' for list of commands.\r\n\r\nsc> ')], position
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self):
+        self.shell_requested = threading.Event()
+
+    # Like the real ALOM, the SSH layer accepts anyone and the login happens inside the shell
+    def get_allowed_auths(self, username):
+        return 'none'
+
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_requested.set()
+        return True
+
+
+class FakeALOMServer:
+    """Local SSH server which plays a ReplaySession to every client that connects.
+
+    Parameters:
+        session: what the fake controller says
+        port: port to listen on, 0 picks a free one (see .port)
+        speed: multiplier applied to recorded delays, 0 answers immediately
+        stall_rate: fraction of command answers which stall for stall_time seconds halfway through, to
+            simulate a controller too slow for the exporter's timeouts
+    """
+
+    def __init__(
+        self,
+        session: ReplaySession,
+        port: int = 0,
+        addr: str = '127.0.0.1',
+        speed: float = 1.0,
+        stall_rate: float = 0.0,
+        stall_time: float = 0.0,
+        host_key=None,
+    ):
+        self.session = session
+        self.speed = speed
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((addr, port))
+        self.sock.listen(100)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self._transports = []
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._accept, name=f'fake-alom-{self.port}', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.sock.close()
+        for transport in self._transports:
+            transport.close()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        self._transports.append(transport)
+        transport.add_server_key(self.host_key)
+        interface = _ServerInterface()
+        try:
+            transport.start_server(server=interface)
+            channel = transport.accept(10)
+            if channel is None or not interface.shell_requested.wait(10):
+                return
+            self._play(channel, self.session.banner)
+            position = 0
+            buf = b''
+            while not self._stopped.is_set():
+                data = channel.recv(1024)
+                if not data:
+                    return
+                buf += data
+                while b'\n' in buf:
+                    line, buf = buf.split(b'\n', 1)
+                    chunks, position = self.session.answer(line.decode('utf-8', 'replace').strip(), position)
+                    self._play(channel, chunks)
+        except (EOFError, OSError, paramiko.SSHException):
+            log.debug(f'Client of fake ALOM on port {self.port} went away')
+        finally:
+            transport.close()
+
+    def _play(self, channel, chunks: list):
+        started = time.monotonic()
+        # Only command output stalls; the login prompts are a single chunk each
+        stalls = len(chunks) > 1 and self.stall_rate and random.random() < self.stall_rate
+        stall_at = len(chunks) // 2 if stalls else None
+        for idx, (offset, data) in enumerate(chunks):
+            if idx == stall_at:
+                time.sleep(self.stall_time)
+                started += self.stall_time
+            wait = offset * self.speed - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+            channel.sendall(data)
+
+
+def main():
+    p = argparse.ArgumentParser(description='Serve recorded or synthesized ALOM sessions over SSH')
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument('-r', '--recording', help='Recording made with the record_path setting')
+    source.add_argument('-e', '--environment', help='Saved "showenvironment" output to answer with')
+    p.add_argument('--port', help='First port to listen on', default=2222, type=int)
+    p.add_argument('-n', '--count', help='Number of fake controllers, on consecutive ports', default=1, type=int)
+    p.add_argument('--delay', help='Seconds to spread a synthesized response over', default=0.8, type=float)
+    p.add_argument('--speed', help='Multiplier for recorded delays', default=1.0, type=float)
+    p.add_argument('--username', default='admin')
+    p.add_argument('--password', default='changeme')
+    p.add_argument('-d', '--debug', help='Enable debug logging', action='store_true')
+    args = p.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    if args.recording:
+        session = ReplaySession.load(args.recording)
+    else:
+        with open(args.environment, 'r') as fh:
+            session = ReplaySession.synthesize(fh.read(), args.username, args.password, delay=args.delay)
+    host_key = paramiko.RSAKey.generate(2048)
+    servers = [
+        FakeALOMServer(session, port=args.port + idx, speed=args.speed, host_key=host_key).start()
+        for idx in range(args.count)
+    ]
+    log.info(f'Serving {len(servers)} fake ALOMs on ports {args.port}-{args.port + args.count - 1}')
+    try:
+        while True:
+            time.sleep(10)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
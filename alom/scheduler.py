@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+from alom.instrumentation import command_queue_depth, command_wait
+
+log = logging.getLogger(__name__)
+
+
+class CommandScheduler:
+    """CommandScheduler owns access to one ALOM channel. Commands run one at a time, with at least
+    min_gap seconds between the end of one command and the start of the next, because the service
+    processor gets overwhelmed when too much is sent at once. A command requested while the same
+    command is already queued or running shares that run's result instead of being sent twice.
+    """
+
+    def __init__(self, name: str, min_gap: float):
+        self.name = name
+        self.min_gap = min_gap
+        self.depth = 0
+        # Created on first use so they belong to the poller's event loop
+        self._lock = None
+        self._pending = {}
+        self._last_finished = float('-inf')
+
+    async def run(self, key: str, command):
+        """Run the coroutine function command, or join the run already pending for key"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._execute(command))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            log.debug(f'Joining pending {key} on {self.name}')
+        # Shielded so one caller giving up doesn't cancel the command for everyone else sharing it
+        return await asyncio.shield(task)
+
+    async def _execute(self, command):
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        self.depth += 1
+        command_queue_depth.labels(self.name).set(self.depth)
+        try:
+            async with self._lock:
+                gap = self._last_finished + self.min_gap - loop.time()
+                if gap > 0:
+                    await asyncio.sleep(gap)
+                command_wait.labels(self.name).observe(loop.time() - queued)
+                try:
+                    return await command()
+                finally:
+                    self._last_finished = loop.time()
+        finally:
+            self.depth -= 1
+            command_queue_depth.labels(self.name).set(self.depth)
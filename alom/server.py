@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+log = logging.getLogger(__name__)
+
+# Seconds a probe may spend refreshing a stale target when Prometheus doesn't say how long it will wait
+DEFAULT_PROBE_TIMEOUT = 10.0
+PROBE_TIMEOUT_OFFSET = 0.5
+
+
+class ExporterHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ExporterHandler(BaseHTTPRequestHandler):
+    """Serves the exporter's own metrics (process, python and instrumentation) from the default registry,
+    followed by the ALOM metrics, which the collector keeps pre-rendered, on /metrics.
+    /probe?target=<name> serves only the metrics of one target, and /history?target=<name>&sensor=<sensor>
+    the readings history of one sensor as JSON."""
+
+    collector = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        content_type = CONTENT_TYPE_LATEST
+        if url.path == '/metrics':
+            output = generate_latest(REGISTRY) + self.collector.render()
+        elif url.path == '/probe':
+            output = self.probe(parse_qs(url.query))
+            if output is None:
+                return
+        elif url.path == '/history':
+            output = self.history(parse_qs(url.query))
+            if output is None:
+                return
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(output)))
+        self.end_headers()
+        self.wfile.write(output)
+
+    def probe(self, query: dict) -> bytes:
+        """Metrics of the one target named in the query, for Prometheus configurations which
+        relabel each target into a probe of the exporter. Sends an error and returns None if there's no such target."""
+        targets = query.get('target')
+        if not targets:
+            self.send_error(400, 'Target parameter is missing')
+            return None
+        # Stay within Prometheus' scrape timeout if refreshing a stale target, leaving time to send the response
+        try:
+            timeout = float(self.headers.get('X-Prometheus-Scrape-Timeout-Seconds', DEFAULT_PROBE_TIMEOUT))
+        except ValueError:
+            timeout = DEFAULT_PROBE_TIMEOUT
+        output = self.collector.render_target(targets[0], max(timeout - PROBE_TIMEOUT_OFFSET, 0))
+        if output is None:
+            self.send_error(404, f'Unknown target {targets[0]}')
+        return output
+
+    def history(self, query: dict) -> bytes:
+        """Readings history of the sensor named in the query, in every table it appears in.
+        Sends an error and returns None if there's no such target or sensor."""
+        targets, sensors = query.get('target'), query.get('sensor')
+        if not targets or not sensors:
+            self.send_error(400, 'Target and sensor parameters are required')
+            return None
+        series = self.collector.history(targets[0], sensors[0])
+        if series is None:
+            self.send_error(404, f'No history kept for target {targets[0]}')
+            return None
+        if not series:
+            self.send_error(404, f'No history of sensor {sensors[0]} on {targets[0]}')
+            return None
+        return json.dumps({'target': targets[0], 'sensor': sensors[0], 'series': series}).encode('utf-8')
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+def start_exporter_server(port: int, collector, addr: str = '') -> ExporterHTTPServer:
+    """Serve /metrics, /probe and /history for the collector from a daemon thread"""
+    handler = type('BoundExporterHandler', (ExporterHandler,), {'collector': collector})
+    server = ExporterHTTPServer((addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='alom-http', daemon=True)
+    thread.start()
+    return server
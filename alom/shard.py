@@ -0,0 +1,345 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from prometheus_client import REGISTRY
+
+from alom.commands import COMMANDS
+from alom.history import history_for
+from alom.instrumentation import TARGET_METRICS
+from alom.logs import cursor_key, state_for
+from alom.poller import LogPoller, Poller, check_commands, fresh
+from alom.pool import build_sessions
+
+log = logging.getLogger(__name__)
+
+# How often workers send changed targets to the front process, and how often they send their instrumentation
+SYNC_INTERVAL = 1.0
+INSTRUMENTATION_INTERVAL = 5.0
+# Delay before restarting a worker which died
+RESTART_DELAY = 5.0
+
+# What the front process needs to know about one target to render it. commands maps command name -> (snapshot, max age),
+# and cursors maps the key of each incremental log command -> its cursor, see alom.logs.
+TargetState = namedtuple(
+    'TargetState', ['name', 'snapshot', 'max_age', 'last_poll_ok', 'connected_at', 'commands', 'cursors']
+)
+
+
+def shard_of(name: str, shards: int) -> int:
+    """Stable across processes and restarts, unlike hash(), so a target stays with the same worker on reload"""
+    return zlib.crc32(name.encode('utf-8')) % shards
+
+
+def split(targets: dict, shards: int) -> list:
+    split_targets = [{} for _ in range(shards)]
+    for name, config in targets.items():
+        split_targets[shard_of(name, shards)][name] = config
+    return split_targets
+
+
+def target_state(name: str, target) -> TargetState:
+    return TargetState(
+        name,
+        target.snapshot,
+        target.max_age,
+        target.last_poll_ok,
+        target.session.connected_at,
+        {command_name: (command.snapshot, command.max_age) for command_name, command in target.commands.items()},
+        {
+            command.key: command.state.get(command.key)
+            for command in target.commands.values()
+            if isinstance(command, LogPoller) and command.state.get(command.key)
+        },
+    )
+
+
+def changed(state: TargetState, previous: TargetState) -> bool:
+    if previous is None:
+        return True
+    # Snapshots are replaced rather than modified, so identity tells whether one is new
+    return (
+        state.snapshot is not previous.snapshot
+        or state.last_poll_ok != previous.last_poll_ok
+        or state.connected_at != previous.connected_at
+        or state.commands.keys() != previous.commands.keys()
+        or any(state.commands[name][0] is not previous.commands[name][0] for name in state.commands)
+    )
+
+
+def worker_configs(targets: dict) -> dict:
+    """Every snapshot and log cursor reaches the front process, which keeps the targets' history and is the
+    only one writing log_state_path, so workers do neither. Otherwise each worker would rewrite the whole
+    file from its own copy, overwriting the other workers' cursors with stale ones."""
+    return {name: dict(config, history_size=0, log_state_path=None) for name, config in targets.items()}
+
+
+def saved_cursors(targets: dict) -> dict:
+    """The log cursors the front process holds for targets, to start their workers from"""
+    cursors = {}
+    for name, config in targets.items():
+        state = state_for(config.get('log_state_path'))
+        for command in config.get('commands') or {}:
+            cursor = state.get(cursor_key(name, command))
+            if cursor:
+                cursors[cursor_key(name, command)] = cursor
+    return cursors
+
+
+def resume_cursors(cursors: dict):
+    """Start a worker's in-memory log state from the front process's cursors, keeping any the worker has moved past"""
+    state = state_for(None)
+    for key, cursor in cursors.items():
+        state.cursors.setdefault(key, cursor)
+
+
+def run_worker(connection, targets: dict, cursors: dict, level: int):
+    """Entry point of a worker process: poll targets and send whatever changed to the front process"""
+    # The front process handles signals and stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    logging.basicConfig(level=level)
+    resume_cursors(cursors)
+    poller = Poller(build_sessions(worker_configs(targets)))
+    poller.start()
+    sent = {}
+    instrumented = 0.0
+    try:
+        while True:
+            if connection.poll(SYNC_INTERVAL):
+                message, argument = connection.recv()
+                if message == 'stop':
+                    break
+                if message == 'reload':
+                    targets, cursors = argument
+                    resume_cursors(cursors)
+                    poller.reload(build_sessions(worker_configs(targets)))
+                elif message == 'refresh' and argument in poller.targets:
+                    # The result goes out with the next round of changes
+                    asyncio.run_coroutine_threadsafe(poller.targets[argument].poll(), poller.loop)
+            states = []
+            targets = poller.targets
+            for name, target in targets.items():
+                state = target_state(name, target)
+                if changed(state, sent.get(name)):
+                    states.append(state)
+                    sent[name] = state
+            for name in set(sent) - set(targets):
+                del sent[name]
+            families = None
+            if time.monotonic() - instrumented >= INSTRUMENTATION_INTERVAL:
+                families = [family for metric in TARGET_METRICS for family in metric.collect()]
+                instrumented = time.monotonic()
+            if states or families:
+                connection.send((states, families))
+    except (EOFError, BrokenPipeError):
+        # The front process went away
+        pass
+    finally:
+        poller.stop()
+
+
+class RemoteSession:
+    def __init__(self, name: str):
+        self.name = name
+        self.connected_at = None
+
+
+class RemoteCommand:
+    def __init__(self, name: str):
+        self.command = COMMANDS[name]
+        self.snapshot = None
+        self.max_age = 0.0
+
+    def current(self, now: float = None):
+        return fresh(self.snapshot, self.max_age, now)
+
+
+class RemoteTarget:
+    """Stands in for a TargetPoller running in a worker process, holding the latest state the worker sent"""
+
+    def __init__(self, name: str, config: dict):
+        self.session = RemoteSession(name)
+        self.snapshot = None
+        self.max_age = 0.0
+        self.last_poll_ok = False
+        self.commands = {}
+        self.history = history_for(config)
+        # Log cursors are saved here, for the worker polling this target to start from after a restart
+        self.log_state = state_for(config.get('log_state_path'))
+
+    def current(self, now: float = None):
+        return fresh(self.snapshot, self.max_age, now)
+
+    def update(self, state: TargetState):
+        commands = {}
+        for name, (snapshot, max_age) in state.commands.items():
+            command = self.commands.get(name) or RemoteCommand(name)
+            command.snapshot, command.max_age = snapshot, max_age
+            commands[name] = command
+        self.commands = commands
+        self.max_age = state.max_age
+        self.session.connected_at = state.connected_at
+        self.last_poll_ok = state.last_poll_ok
+        for key, cursor in state.cursors.items():
+            self.log_state.set(key, cursor)
+        # States are unpickled copies, so a snapshot sent again is recognised by its timestamp
+        if self.history is not None and state.snapshot is not None and (
+            self.snapshot is None or state.snapshot.timestamp != self.snapshot.timestamp
+        ):
+            self.history.record(state.snapshot)
+        self.snapshot = state.snapshot
+
+
+class Worker:
+    def __init__(self, index: int, targets: dict, level: int):
+        self.index = index
+        self.targets = targets
+        self.level = level
+        self.process = None
+        self.connection = None
+        self.families = []
+        # Reloads and probe refreshes are sent from different threads
+        self._send_lock = threading.Lock()
+
+    def send(self, message: tuple):
+        with self._send_lock:
+            self.connection.send(message)
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(child, self.targets, saved_cursors(self.targets), self.level),
+            name=f'alom-worker-{self.index}',
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+
+class ShardedPoller:
+    """ShardedPoller splits the targets between worker processes, each running its own Poller, so SSH
+    encryption for a large fleet is spread over several cores instead of contending for one GIL.
+    Workers send snapshots back over a pipe only when they change. The targets mapping holds a
+    RemoteTarget per target, which ALOMCollector renders like a local TargetPoller, and the workers'
+    per-target instrumentation is served from the front process by collect().
+    Like Poller, targets is replaced rather than modified on reload.
+    """
+
+    def __init__(self, targets: dict, workers: int, level: int = logging.INFO):
+        self.configs = dict(targets)
+        self.targets = {name: RemoteTarget(name, config) for name, config in targets.items()}
+        self.workers = [
+            Worker(index, shard, level) for index, shard in enumerate(split(targets, workers))
+        ]
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        # Served by collect() instead, merged with the workers' copies
+        for metric in TARGET_METRICS:
+            REGISTRY.unregister(metric)
+        REGISTRY.register(self)
+        for worker in self.workers:
+            worker.start()
+            thread = threading.Thread(target=self._receive, args=(worker,), name=f'alom-shard-{worker.index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _receive(self, worker: Worker):
+        while not self._stopping.is_set():
+            try:
+                states, families = worker.connection.recv()
+            except (EOFError, OSError):
+                if self._stopping.is_set():
+                    return
+                log.error(f'Worker {worker.index} exited with {worker.process.exitcode}, restarting in {RESTART_DELAY}s')
+                time.sleep(RESTART_DELAY)
+                worker.start()
+                continue
+            targets = self.targets
+            for state in states:
+                target = targets.get(state.name)
+                # A target removed by a reload may still have an update in flight
+                if target is not None:
+                    target.update(state)
+            if families is not None:
+                worker.families = families
+
+    def collect(self):
+        """Merge each worker's per-target instrumentation, and this process's, into one set of metric families"""
+        merged = {}
+        # Rendering happens in this process, so its own samples are merged with the workers'
+        local = [family for metric in TARGET_METRICS for family in metric.collect()]
+        for families in [local] + [worker.families for worker in self.workers]:
+            for family in families:
+                if family.name not in merged:
+                    merged[family.name] = copy.copy(family)
+                    merged[family.name].samples = []
+                merged[family.name].samples.extend(family.samples)
+        return list(merged.values())
+
+    def refresh(self, name: str, timeout: float) -> bool:
+        """Ask the worker owning a target to poll it now, and wait at most timeout seconds for a new snapshot"""
+        target = self.targets.get(name)
+        if target is None:
+            return False
+        snapshot = target.snapshot
+        try:
+            self.workers[shard_of(name, len(self.workers))].send(('refresh', name))
+        except OSError:
+            return False
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if target.snapshot is not snapshot:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def reload(self, targets: dict) -> (list, list, list):
+        """Send each worker its share of targets, a mapping of target name -> configuration.
+        Return the names of the added, removed and changed targets."""
+        # Checked here, since a worker which fails to build a target would die and restart into the same failure
+        for name, config in targets.items():
+            check_commands(name, config)
+        added = [name for name in targets if name not in self.configs]
+        removed = [name for name in self.configs if name not in targets]
+        changed = [name for name in targets if name in self.configs and targets[name] != self.configs[name]]
+        for worker, shard in zip(self.workers, split(targets, len(self.workers))):
+            worker.targets = shard
+            try:
+                worker.send(('reload', (shard, saved_cursors(shard))))
+            except OSError:
+                # The worker died; it is restarted with its new share of targets
+                log.warning(f'Worker {worker.index} is down, its targets will be reloaded when it restarts')
+        running = self.targets
+        # Like Poller, a changed target starts over, so its history follows its new configuration
+        self.targets = {
+            name: running[name] if name in running and name not in changed else RemoteTarget(name, config)
+            for name, config in targets.items()
+        }
+        self.configs = dict(targets)
+        return added, removed, changed
+
+    def stop(self):
+        self._stopping.set()
+        for worker in self.workers:
+            try:
+                worker.send(('stop', None))
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join(10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        REGISTRY.unregister(self)
+        for metric in TARGET_METRICS:
+            REGISTRY.register(metric)
@@ -0,0 +1,131 @@
+import sys
+from array import array
+from collections.abc import Mapping
+
+
+class Schema:
+    """The columns of one kind of table. Shared by every table with the same columns, see schema_for()."""
+
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns: tuple):
+        self.columns = columns
+        self.index = {column: position for position, column in enumerate(columns)}
+
+    def __reduce__(self):
+        # Unpickled schemas come from the cache too, so a worker's snapshots share them in the front process
+        return schema_for, (self.columns,)
+
+
+_schemas = {}
+
+
+def schema_for(columns) -> Schema:
+    """Return the Schema for a sequence of column names, building it the first time those columns are seen"""
+    columns = tuple(columns)
+    schema = _schemas.get(columns)
+    if schema is None:
+        schema = _schemas[columns] = Schema(tuple(sys.intern(column) for column in columns))
+    return schema
+
+
+class Row(Mapping):
+    """Read-only view of one row of a Table, mapping column name -> value like the dict it replaces"""
+
+    __slots__ = ('table', 'offset')
+
+    def __init__(self, table: 'Table', offset: int):
+        self.table = table
+        self.offset = offset
+
+    def __getitem__(self, column: str) -> float:
+        return self.table.values[self.offset + self.table.schema.index[column]]
+
+    def __iter__(self):
+        return iter(self.table.schema.columns)
+
+    def __len__(self) -> int:
+        return len(self.table.schema.columns)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class Table(Mapping):
+    """One parsed table, mapping sensor name -> row like the dict of dicts it replaces. Rather than a dict
+    per row, the values of every row are stored one row after another in a single array of doubles, the
+    column names are shared through the table's Schema and sensor names are interned, so the same names
+    aren't stored again in every snapshot. Tables parsed from the same output compare equal in one
+    comparison of their arrays, and column() gives one column of every row without looking rows up.
+    """
+
+    __slots__ = ('schema', 'names', 'index', 'values')
+
+    def __init__(self, schema: Schema, names: list = None, index: dict = None, values: array = None):
+        self.schema = schema
+        # Sensor names in row order, and sensor name -> row number
+        self.names = [] if names is None else names
+        self.index = {} if index is None else index
+        self.values = array('d') if values is None else values
+
+    def append(self, name: str, values):
+        """Add a row of values in schema order. Like a dict, a sensor listed twice keeps the last values."""
+        width = len(self.schema.columns)
+        row = self.index.get(name)
+        if row is None:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.values.extend(values)
+        else:
+            self.values[row * width : (row + 1) * width] = array('d', values)
+
+    def __getitem__(self, name: str) -> Row:
+        return Row(self, self.index[name] * len(self.schema.columns))
+
+    def __contains__(self, name) -> bool:
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def items(self):
+        width = len(self.schema.columns)
+        return [(name, Row(self, row * width)) for row, name in enumerate(self.names)]
+
+    def column(self, column: str) -> array:
+        """Return the value of one column for every row, in row order, or None if the table has no such column"""
+        position = self.schema.index.get(column)
+        if position is None:
+            return None
+        return self.values[position :: len(self.schema.columns)]
+
+    def __eq__(self, other) -> bool:
+        if other is self:
+            return True
+        if isinstance(other, Table) and self.names == other.names:
+            return self.schema.columns == other.schema.columns and self.values == other.values
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr({name: dict(row) for name, row in self.items()})
+
+    def __reduce__(self):
+        return _restore_table, (self.schema, self.names, self.values)
+
+
+def _restore_table(schema: Schema, names: list, values: array) -> Table:
+    names = [sys.intern(name) for name in names]
+    return Table(schema, names, {name: row for row, name in enumerate(names)}, values)
+
+
+def column_items(table: Mapping, column: str) -> list:
+    """Return (sensor, value) pairs for the rows of a table, a Table or a plain dict of dicts, which have the column"""
+    if isinstance(table, Table):
+        values = table.column(column)
+        return [] if values is None else list(zip(table.names, values))
+    return [(sensor, readings[column]) for sensor, readings in table.items() if column in readings]
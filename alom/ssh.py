@@ -1,12 +1,17 @@
+import asyncio
 import logging
+import threading
 import time
 from contextlib import suppress
 
-import paramiko
-import yaml
+from alom.config import required_properties
+from alom.instrumentation import backoff_increases, backoff_seconds, command_duration, phase_duration
 
 log = logging.getLogger(__name__)
 
+# Printed by the ALOM when it is ready for the next command
+PROMPT = b'sc> '
+
 
 class ALOMConnection:
     """ALOMConnection wraps a paramiko.client to authenticate with Sun Integrated Lights-Out Management via SSH.
@@ -14,15 +19,22 @@ class ALOMConnection:
     Initial authentication takes some time (~5s) but subsequent calls are relatively quick.
     """
 
-    def __init__(self, config_path):
-        with open(config_path, 'r') as stream:
-            config = yaml.safe_load(stream)
-        # Establish delay times. These are necessary because the ALOM processor generally
-        # runs slower than this daemon, and sending too much data at once causes it to get overwhelmed.
-        # Authentication delay doesn't need much configuration; 2s seems to work in most cases.
+    def __init__(self, config_path: str = None, config: dict = None, name: str = None):
+        if config is None:
+            import yaml
+
+            with open(config_path, 'r') as stream:
+                config = yaml.safe_load(stream)
+        # Copy so the defaults below don't leak into a shared fleet configuration
+        config = dict(config)
+        # Target name used as the "target" label on every metric
+        self.name = name or config.get('alom_ssh_address', 'default')
+        # Authentication used to sleep this long between prompts. It now waits for each prompt instead, and the
+        # setting is only kept so configuration files which set it keep working.
         if not 'alom_authentication_delay' in config:
             config['alom_authentication_delay'] = 2
-        # The delay before parsing "showenvironment" output, however, varies greatly depending
+        # Responses are read until the "sc> " prompt comes back. If it doesn't, we fall back to waiting
+        # out a delay before parsing "showenvironment" output, which varies greatly depending
         # on system state. 350ms works for a powered-off system, but a powered on system
         # needs more like 3s- we use a backoff between these two values unless we know the
         # system power state.
@@ -30,6 +42,25 @@ class ALOMConnection:
             config['max_environment_delay'] = 3.00
         if not 'min_environment_delay' in config:
             config['min_environment_delay'] = 0.35
+        # Reads which wait for the "sc> " prompt give up after this many seconds
+        if not 'command_timeout' in config:
+            config['command_timeout'] = 10.0
+        # Each step of opening a session (TCP connect, SSH banner and handshake, authentication, opening the
+        # shell) gives up after this many seconds, so an unreachable controller doesn't hold a connecting thread
+        # for the operating system's TCP timeout
+        if not 'connect_timeout' in config:
+            config['connect_timeout'] = 20.0
+        # Commands sent on one session are spaced at least this many seconds apart
+        if not 'min_command_gap' in config:
+            config['min_command_gap'] = 0.25
+        # Idle sessions are kept alive with an empty command this often. A session which fails is reopened after
+        # a jittered delay that doubles on each failed attempt, between the min and max reconnect delay.
+        if not 'keepalive_interval' in config:
+            config['keepalive_interval'] = 60.0
+        if not 'reconnect_min_delay' in config:
+            config['reconnect_min_delay'] = 1.0
+        if not 'reconnect_max_delay' in config:
+            config['reconnect_max_delay'] = 300.0
         # if we know the system is powered on, we need to swap to the maximum wait time
         self.last_measurement_on = False
         # Backoff configuration for the above environment delay. By default, start with the minimum
@@ -39,94 +70,124 @@ class ALOMConnection:
         self.config = config
         self.client = None
         self.channel = None
+        # Label lookups are cached so timing every phase stays cheap
+        self.phases = {
+            phase: phase_duration.labels(self.name, phase)
+            for phase in ('connect', 'auth', 'command', 'backoff')
+        }
+        # Set once the connection is used rather than here: a reload builds connections for unchanged targets
+        # too, and would otherwise reset their running value
+        self.backoff_gauge = backoff_seconds.labels(self.name)
 
     def increase_backoff(self):
         new_wait = self.backoff * self.backoff_scaling_factor
         proper_wait = min(new_wait, self.config['max_environment_delay'])
         self.backoff = proper_wait
+        backoff_increases.labels(self.name).inc()
+        self.backoff_gauge.set(self.get_backoff())
         return proper_wait
 
     def get_backoff(self):
         return self.config['max_environment_delay'] if self.last_measurement_on else self.backoff
 
-    def __enter__(self):
-        for required_property in ['alom_ssh_address', 'alom_ssh_username', 'alom_ssh_password']:
+    def open_channel(self):
+        """Connect to the SSH server and open an interactive shell. The ALOM login prompt
+        still needs to be answered before commands can be sent, see authenticate().
+        """
+        for required_property in required_properties:
             if not required_property in self.config:
-                raise Exception('Property {required_property} not found in configuration file')
+                raise Exception(f'Property {required_property} not found in configuration for {self.name}')
+        # paramiko and the crypto libraries under it take longer to import than the rest of the exporter,
+        # so they're loaded when the first connection is made rather than by everything importing alom.ssh
+        import paramiko
+
         client = paramiko.client.SSHClient()
         client.load_system_host_keys()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
+        self.backoff_gauge.set(self.get_backoff())
         log.debug(f'Connecting to {self.config["alom_ssh_address"]} over SSH')
+        timeout = self.config['connect_timeout']
+        started = time.monotonic()
         # Authentication happens with the "none" method, which is not officially supported.
         # https://github.com/paramiko/paramiko/issues/890
         with suppress(paramiko.ssh_exception.AuthenticationException):
             client.connect(
                 self.config['alom_ssh_address'],
+                port=self.config.get('alom_ssh_port', 22),
                 username=self.config['alom_ssh_username'],
                 password=self.config['alom_ssh_password'],
                 look_for_keys=False,
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout,
             )
         log.debug(f'Authenticating as {self.config["alom_ssh_username"]}')
         client.get_transport().auth_none(self.config['alom_ssh_username'])
         self.client = client
         log.debug('Requesting pty')
-        self.channel = client.invoke_shell()
+        # paramiko waits for the pty and shell requests to be answered without a timeout. Closing the
+        # client wakes it up with an exception, so a controller which never answers can't hang this thread.
+        watchdog = threading.Timer(timeout, client.close)
+        watchdog.start()
+        try:
+            self.channel = client.invoke_shell()
+        finally:
+            watchdog.cancel()
+        self.phases['connect'].observe(time.monotonic() - started)
+        if self.config.get('record_path'):
+            # Capture the raw session so it can be replayed later with alom_replay
+            from alom.replay import RecordingChannel
+
+            self.channel = RecordingChannel(self.channel, self.config['record_path'])
+
+    def __enter__(self):
+        # The blocking API drives the same prompt-reading code as the poller, on an event loop of its own
+        from alom.aio import AsyncALOMSession
 
-        if self.authenticate():
-            log.debug('Connection successful')
-            return self
-        else:
-            self.client.close()
-            raise Exception('ALOM authentication failed')
+        asyncio.run(AsyncALOMSession(self).open())
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.client.close()
 
-    def authenticate(self) -> bool:
-        delay = self.config['alom_authentication_delay']
-        log.info(f'Using {delay}s authentication delay')
-        buf = b''
-        while not buf.startswith(b'Please login:'):
-            buf = self.channel.recv(10000)
-            log.debug(buf.decode('utf-8'))
-        sent = self.channel.send(self.config['alom_ssh_username'] + '\n')
-        log.debug(f'Sent {sent} bytes, sleeping {delay} seconds')
-        time.sleep(delay)
-        buf = self.channel.recv(10000)
-        trimmed = buf[sent + 1 :]
-
-        if not trimmed.startswith(b'Please Enter password:'):
-            log.warning(f'Authentication failed before sending password {buf}')
-            return False
-
-        log.debug(f'{buf}')
-        sent = self.channel.send(self.config['alom_ssh_password'] + '\n')
-        log.debug(f'Sent {sent} bytes, sleeping {delay} seconds')
-        time.sleep(delay)
-        buf = self.channel.recv(10000)
-        buf = buf[sent + 1 :]
-        log.debug(f'{buf}')
-
-        if b'sc> ' in buf:
-            log.info('Authentication succeeded!')
-            return True
-        log.warning(f'Authentication failed after sending password: {buf}')
-        return False
+    def record_response_time(self, command: str, seconds: float):
+        log.debug(f'{command} on {self.name} answered in {seconds:.3f}s')
+        # Options such as the number of log lines requested would otherwise each get their own series
+        command_duration.labels(self.name, command.split(' ', 1)[0]).observe(seconds)
 
     def showenvironment(self) -> str:
-        backoff = self.get_backoff()
-        sent = self.channel.send('showenvironment\n')
-        log.info(f'Environment request waiting for {backoff}s')
-        time.sleep(backoff)
-        buf = self.channel.recv(40000)
+        from alom.aio import AsyncALOMSession
+
+        return asyncio.run(AsyncALOMSession(self).showenvironment()).decode('utf-8')
+
+    def response_bytes(self, buf: bytes, sent: int) -> bytes:
+        """Strip the echoed command and the prompt which ended the read from a raw response"""
         buf = buf[sent + 1 :]
-        from_the_binary = buf.decode('utf-8')
-        log.debug(from_the_binary)
+        # The prompt that ended the read isn't part of the response, and would otherwise look like a table row
+        if buf.endswith(PROMPT):
+            buf = buf[: -len(PROMPT)]
+        return buf
+
+    def command_response(self, buf: bytes, sent: int) -> str:
+        """Strip the echoed command and the prompt from a raw response and decode it"""
+        return self.response_bytes(buf, sent).decode('utf-8')
+
+    def environment_bytes(self, buf: bytes, sent: int) -> bytes:
+        """Strip a raw "showenvironment" response without decoding it, tracking the system power state for
+        the backoff logic. The result can be handed straight to alom.parse.parse_showenvironment_bytes."""
+        from_the_binary = self.response_bytes(buf, sent)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(from_the_binary.decode('utf-8', 'replace'))
         # Flag any changes in power status so the backoff can be changed
-        power_is_on = 'power is off' not in from_the_binary
+        power_is_on = b'power is off' not in from_the_binary
         if not power_is_on and power_is_on != self.last_measurement_on:
             # Power was just turned off! Reset the backoff logic with the minimum wait
             self.backoff = self.config['min_environment_delay']
         self.last_measurement_on = power_is_on
+        self.backoff_gauge.set(self.get_backoff())
         return from_the_binary
+
+    def environment_response(self, buf: bytes, sent: int) -> str:
+        """Decode a raw "showenvironment" response, tracking the system power state for the backoff logic."""
+        return self.environment_bytes(buf, sent).decode('utf-8')
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""Benchmarks for the parser and metric rendering, built from the sample sessions in test/.
+
+Run from the repository root:
+
+    python bench/run_benchmarks.py                       # print results
+    python bench/run_benchmarks.py --save baseline.json  # record a baseline
+    python bench/run_benchmarks.py --compare baseline.json
+
+With --compare, the exit status is non-zero if any benchmark got slower than the baseline by more than
+--threshold, so a release can be checked for regressions before it ships.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from alom.metrics import ALOMCollector  # noqa: E402
+from alom.parse import (  # noqa: E402
+    atoi,
+    parse_showenvironment,
+    parse_showenvironment_bytes,
+    parse_system_indicator_status,
+    parse_table,
+)
+from alom.poller import Snapshot, TargetPoller  # noqa: E402
+
+FIXTURES = ['test/t1000_on_0.txt', 'test/t2000_on_docs_example.txt', 'test/t2000_off_docs_example.txt']
+# Table headers whose rows are multiplied to build synthetic sessions
+SCALED_TABLES = ['System Temperatures', 'Voltage sensors', 'Fans (Speeds', 'System Load', 'Current sensors']
+
+
+def load_session(path):
+    with open(path, 'r') as fh:
+        return [line.strip() for line in fh.read().splitlines()]
+
+
+def scaled_session(lines, factor):
+    """Repeat every row of the sensor tables factor times with unique sensor names,
+    to model controllers (or future firmware) reporting hundreds of sensors."""
+    scaled = []
+    in_table = False
+    for line in lines:
+        if any(line.startswith(table) for table in SCALED_TABLES):
+            in_table = True
+        elif line == '':
+            in_table = False
+        if in_table and line[:1].isupper() and not line.endswith(':') and not line.startswith('Sensor'):
+            name, rest = line.split(None, 1)
+            scaled.extend(f'{name}_{copy} {rest}' for copy in range(factor))
+        else:
+            scaled.append(line)
+    return scaled
+
+
+class StaticSession:
+    def __init__(self, name):
+        self.name = name
+        self.config = {'poll_interval': 30.0, 'max_snapshot_age': 1e12}
+        self.connected_at = time.time()
+
+
+def collector_for(data, targets):
+    """Collector serving the same parsed response for the given number of targets"""
+    pollers = {}
+    now = time.time()
+    for target in range(targets):
+        poller = TargetPoller(StaticSession(f'target{target}'))
+        poller.snapshot = Snapshot(data, now)
+        poller.last_poll_ok = True
+        pollers[f'target{target}'] = poller
+    return ALOMCollector(pollers)
+
+
+def refreshed(collector):
+    """Give every target a new snapshot object with the same data, forcing the cached exposition to be checked"""
+    for poller in collector.pollers.values():
+        poller.snapshot = poller.snapshot._replace(timestamp=time.time())
+    return collector.render()
+
+
+def table_start(lines, header):
+    return next(idx for idx, line in enumerate(lines) if line.startswith(header))
+
+
+def benchmarks():
+    """Yield (name, callable) pairs"""
+    sessions = {os.path.basename(path)[:-4]: load_session(path) for path in FIXTURES}
+    sessions['t2000_on_x10'] = scaled_session(sessions['t2000_on_docs_example'], 10)
+    sessions['t2000_on_x50'] = scaled_session(sessions['t2000_on_docs_example'], 50)
+    for name, lines in sessions.items():
+        yield f'parse_showenvironment[{name}]', lambda lines=lines: parse_showenvironment(lines)
+        # What the poller does with a response: parsing it as bytes, or decoding and splitting it first
+        raw = '\r\n'.join(lines).encode('utf-8')
+        yield f'parse_response_str[{name}]', lambda raw=raw: parse_showenvironment(
+            [line.strip() for line in raw.decode('utf-8').splitlines()]
+        )
+        yield f'parse_response_bytes[{name}]', lambda raw=raw: parse_showenvironment_bytes(raw)
+    t2000 = sessions['t2000_on_docs_example']
+    voltage = table_start(t2000, 'Voltage sensors')
+    yield 'parse_table[t2000_voltage]', lambda: parse_table(t2000, voltage)
+    indicator = table_start(t2000, 'System Indicator Status')
+    yield 'parse_system_indicator_status[t2000]', lambda: parse_system_indicator_status(t2000, indicator)
+    yield 'atoi[float]', lambda: atoi('12.18')
+    yield 'atoi[status]', lambda: atoi('NOT PRESENT')
+    for name, targets in [('t2000_on_docs_example', 1), ('t2000_on_docs_example', 80), ('t2000_on_x10', 1)]:
+        collector = collector_for(parse_showenvironment(sessions[name]), targets)
+        yield f'render[{name},targets={targets}]', collector.render
+        yield f'render_new_snapshot[{name},targets={targets}]', lambda collector=collector: refreshed(collector)
+        data = parse_showenvironment(sessions[name])
+        yield f'render_cold[{name},targets={targets}]', lambda data=data, targets=targets: collector_for(
+            data, targets
+        ).render()
+
+
+def measure(fn, number, repeat):
+    per_call = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ops_per_sec': 1 / per_call, 'us_per_op': per_call * 1e6, 'peak_kib': peak / 1024}
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', '--number', help='Calls per timing run', default=200, type=int)
+    p.add_argument('-r', '--repeat', help='Timing runs per benchmark; the fastest is reported', default=5, type=int)
+    p.add_argument('-k', '--filter', help='Only run benchmarks whose name contains this string', default='')
+    p.add_argument('--save', help='Write results to this JSON file')
+    p.add_argument('--compare', help='Compare results against a JSON file written by --save')
+    p.add_argument('--threshold', help='Allowed slowdown against --compare', default=0.25, type=float)
+    args = p.parse_args()
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r') as fh:
+            baseline = json.load(fh)
+    results = {}
+    regressions = []
+    print(f'{"benchmark":56} {"us/op":>10} {"ops/s":>10} {"peak KiB":>9} {"change":>8}')
+    for name, fn in benchmarks():
+        if args.filter not in name:
+            continue
+        result = measure(fn, args.number, args.repeat)
+        results[name] = result
+        change = ''
+        if name in baseline:
+            ratio = result['us_per_op'] / baseline[name]['us_per_op'] - 1
+            change = f'{ratio:+.0%}'
+            if ratio > args.threshold:
+                regressions.append(name)
+        print(
+            f'{name:56} {result["us_per_op"]:10.1f} {result["ops_per_sec"]:10.0f} {result["peak_kib"]:9.1f} {change:>8}'
+        )
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    if regressions:
+        print(f'{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
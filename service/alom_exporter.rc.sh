@@ -10,7 +10,6 @@ daemon_user=_alom_exporter
 
 pexp="/usr/local/bin/python3.*${daemon}.*"
 rc_bg=YES
-rc_reload=NO
 
 rc_start() {
   ${rcexec} "${daemon} ${daemon_flags} 2>&1 | \
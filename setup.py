@@ -22,7 +22,9 @@ setup(
     py_modules=[],
     entry_points={
         'console_scripts': [
-            'alom_exporter = alom.metrics:main'
+            'alom_exporter = alom.metrics:main',
+            'alom_replay = alom.replay:main',
+            'alom_loadtest = alom.loadtest:main',
         ]
     },
     python_requires='>=3.6',
@@ -1,5 +1,11 @@
+import select
+import socket
+
 import pytest
 
+from alom.exceptions import PartialResponseException
+from alom.replay import FakeALOMServer, ReplaySession
+
 
 @pytest.fixture
 def sample_session():
@@ -8,3 +14,114 @@ def sample_session():
             return [line.strip() for line in fh.read().splitlines()]
 
     return _sample_session
+
+
+class FakeConnection:
+    """Stands in for an ALOMConnection by returning a saved "showenvironment" session.
+    A connection without a session path responds with a partial response.
+    Other commands answer with the saved output in outputs, which maps command name -> path.
+    """
+
+    def __init__(self, name, path=None, outputs=None):
+        self.name = name
+        self.path = path
+        self.outputs = outputs or {}
+        self.config = {
+            'poll_interval': 30.0,
+            'max_snapshot_age': 90.0,
+            'retry_delay': 5.0,
+            'commands': {command: None for command in self.outputs},
+            'log_window': 10,
+            'max_log_window': 640,
+        }
+        self.backoff_increases = 0
+        self.connected_at = 1600000000.0
+        self.closed = False
+
+    async def open(self):
+        return self
+
+    def close(self):
+        self.closed = True
+
+    async def showenvironment(self):
+        if self.path is None:
+            raise PartialResponseException()
+        with open(self.path, 'rb') as fh:
+            return fh.read()
+
+    async def run_command(self, command):
+        # Options such as "-e 10" are ignored
+        with open(self.outputs[command.split()[0]], 'r') as fh:
+            return fh.read()
+
+    def increase_backoff(self):
+        self.backoff_increases += 1
+
+
+@pytest.fixture
+def fake_connection():
+    return FakeConnection
+
+
+class SocketChannel:
+    """Minimal stand-in for a paramiko channel backed by a local socket pair.
+    Whatever the test sends from the remote end is what the exporter reads. Data passed to reply()
+    is sent from the remote end once the exporter sends its next command."""
+
+    def __init__(self):
+        self.remote, self.local = socket.socketpair()
+        self.local.setblocking(False)
+        self.closed = False
+        self.eof_received = False
+        self.replies = []
+
+    def reply(self, data):
+        self.replies.append(data)
+
+    def fileno(self):
+        return self.local.fileno()
+
+    def settimeout(self, timeout):
+        self.local.settimeout(timeout)
+
+    def recv_ready(self):
+        return bool(select.select([self.local], [], [], 0)[0])
+
+    def recv(self, nbytes):
+        return self.local.recv(nbytes)
+
+    def send(self, data):
+        sent = self.local.send(data.encode('utf-8') if isinstance(data, str) else data)
+        if self.replies:
+            self.remote.send(self.replies.pop(0))
+        return sent
+
+
+@pytest.fixture
+def socket_channel():
+    channel = SocketChannel()
+    yield channel
+    channel.remote.close()
+    channel.local.close()
+
+
+@pytest.fixture
+def environment():
+    with open('test/t2000_on_docs_example.txt', 'r') as fh:
+        return fh.read()
+
+
+@pytest.fixture
+def fake_alom(environment):
+    servers = []
+
+    def _fake_alom(session=None, **kwargs):
+        session = session or ReplaySession.synthesize(environment, 'admin', 'changeme', delay=0.05)
+        server = FakeALOMServer(session, **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield _fake_alom
+    for server in servers:
+        server.stop()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from alom.aio import AsyncALOMSession, read_until
+from alom.exceptions import PromptTimeoutException
+from alom.poller import scrape
+from alom.ssh import ALOMConnection
+
+
+def test_read_until_prompt(socket_channel):
+    async def _read():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, socket_channel.remote.send, b'showenvironment\r\n')
+        loop.call_later(0.05, socket_channel.remote.send, b'Environmental Status\r\nsc> ')
+        return await read_until(socket_channel, (b'sc> ',), 1.0)
+
+    buf = asyncio.run(_read())
+    assert buf == b'showenvironment\r\nEnvironmental Status\r\nsc> '
+
+
+def test_read_until_timeout(socket_channel):
+    socket_channel.remote.send(b'showenvironment\r\nEnvironmental')
+    with pytest.raises(PromptTimeoutException) as e:
+        asyncio.run(read_until(socket_channel, (b'sc> ',), 0.05))
+    assert e.value.buf == b'showenvironment\r\nEnvironmental', "partial buffer was not kept"
+
+
+def test_run_command_strips_echo_and_prompt(tmp_path, socket_channel):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text("command_timeout: 0.5\n")
+    connection = ALOMConnection(str(p))
+    connection.channel = socket_channel
+    with open('test/t2000_showplatform.txt', 'rb') as fh:
+        socket_channel.reply(b'showplatform\r\n' + fh.read() + b'sc> ')
+    output = asyncio.run(AsyncALOMSession(connection).run_command('showplatform'))
+    assert output.startswith('SUNW,Sun-Fire-T200')
+    assert not output.endswith('sc> '), "prompt was left on the response"
+
+
+def test_response_without_prompt_is_partial(tmp_path, socket_channel):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text("command_timeout: 0.05\nmin_environment_delay: 0.05\nmax_environment_delay: 1.0\n")
+    connection = ALOMConnection(str(p))
+    connection.channel = socket_channel
+    with open('test/t2000_on_docs_example.txt', 'rb') as fh:
+        response = fh.read()
+    # Cut off partway through, where the tables read so far would parse
+    socket_channel.reply(b'showenvironment\r\n' + response[: len(response) // 2])
+    session = AsyncALOMSession(connection)
+    assert asyncio.run(scrape(session)) is None, "response without a prompt was parsed"
+    assert connection.get_backoff() == 0.1, "backoff was not increased"
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from alom.commands import COMMANDS
+from alom.metrics import ALOMCollector
+from alom.parse_faults import parse_showfaults
+from alom.parse_logs import parse_showlogs
+from alom.parse_platform import parse_showplatform
+from alom.parse_power import parse_showpower
+from alom.poller import TargetPoller
+
+
+def test_showfaults(sample_session):
+    faults = parse_showfaults(sample_session('test/t2000_showfaults.txt'))
+    assert faults == [
+        {'id': 0, 'fru': 'FT0.F2', 'fault': 'SYS_FAN at FT0.F2 has FAILED.'},
+        {'id': 1, 'fru': 'PS1', 'fault': 'PS1 output is out of range'},
+    ]
+    assert parse_showfaults(sample_session('test/t2000_showfaults_none.txt')) == []
+
+
+def test_showfaults_verbose():
+    lines = ['ID Time              FRU               Fault', '0 SEP 09 11:09:26   FT0/FM0           SP detected fault']
+    assert parse_showfaults(lines) == [{'id': 0, 'time': 'SEP 09 11:09:26', 'fru': 'FT0/FM0', 'fault': 'SP detected fault'}]
+
+
+def test_showplatform(sample_session):
+    platform = parse_showplatform(sample_session('test/t2000_showplatform.txt'))
+    assert platform == {'model': 'SUNW,Sun-Fire-T200', 'serial': '0529AP000882', 'domains': {'S0': 'OS Standby'}}
+
+
+def test_showlogs(sample_session):
+    events = parse_showlogs(sample_session('test/t2000_showlogs.txt'))
+    assert len(events) == 5
+    assert events[2]['source'] == 'Fault'
+    assert events[2]['severity'] == 'critical'
+    assert events[2]['message'].endswith('Input power unavailable for PSU at PS1.')
+    # Older ALOM firmware prints event codes rather than severities
+    legacy = parse_showlogs(['MAR 09 16:54:27 wgs40-58: 00060003: "SC System booted."'])
+    assert legacy == [
+        {'time': 'MAR 09 16:54:27', 'source': 'wgs40-58', 'code': '00060003', 'message': 'SC System booted.', 'severity': 'unknown'}
+    ]
+
+
+def test_showpower(sample_session):
+    power = parse_showpower(sample_session('test/showpower_example.txt'))
+    assert power['supplies']['PS0'] == {'Status': 1.0, 'InputPower': 263.0, 'OutputPower': 214.0}
+    assert power['total'] == {'InputPower': 522.0, 'OutputPower': 424.0}
+
+
+def test_commands_polled_independently(fake_connection):
+    connection = fake_connection(
+        't2000',
+        'test/t2000_on_docs_example.txt',
+        outputs={'showfaults': 'test/t2000_showfaults.txt', 'showplatform': 'test/t2000_showplatform.txt'},
+    )
+    connection.config['commands']['showplatform'] = 3600.0
+    poller = TargetPoller(connection)
+    assert poller.commands['showfaults'].interval == COMMANDS['showfaults'].interval
+    assert poller.commands['showplatform'].max_age == 3 * 3600.0
+    asyncio.run(poller.poll())
+    asyncio.run(poller.commands['showfaults'].poll())
+    text = ALOMCollector({'t2000': poller}).render().decode('utf-8')
+    assert 'alom_faults{target="t2000"} 2.0' in text
+    assert 'alom_fault{target="t2000",id="0",fru="FT0.F2",fault="SYS_FAN at FT0.F2 has FAILED."} 1.0' in text
+    assert 'alom_command_last_success_timestamp_seconds{target="t2000",command="showfaults"}' in text
+    # showplatform hasn't answered yet, so none of its families are exported
+    assert 'alom_platform_info' not in text
+
+
+def test_unknown_command(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    connection.config['commands'] = {'showeverything': None}
+    with pytest.raises(Exception, match='Unknown command showeverything'):
+        TargetPoller(connection)
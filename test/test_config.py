@@ -0,0 +1,41 @@
+import pytest
+
+from alom.config import load_targets, with_defaults
+
+
+def test_single_target_config(tmp_path):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text("alom_ssh_address: 10.0.0.1\nalom_ssh_username: admin\nalom_ssh_password: changeme\n")
+    targets = load_targets(str(p))
+    assert list(targets) == ['10.0.0.1'], "legacy config was not named after its address"
+    assert targets['10.0.0.1']['alom_ssh_username'] == 'admin'
+
+
+def test_fleet_config(tmp_path):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text(
+        "alom_ssh_username: exporter\n"
+        "alom_ssh_password: changeme\n"
+        "max_environment_delay: 5.0\n"
+        "targets:\n"
+        "  t2000-a:\n"
+        "    alom_ssh_address: 10.0.0.1\n"
+        "  t1000-b:\n"
+        "    alom_ssh_address: 10.0.0.2\n"
+        "    alom_ssh_password: other\n"
+    )
+    targets = load_targets(str(p))
+    assert set(targets) == {'t2000-a', 't1000-b'}
+    assert targets['t2000-a']['alom_ssh_password'] == 'changeme', "default was not applied to target"
+    assert targets['t1000-b']['alom_ssh_password'] == 'other', "target did not override default"
+    assert targets['t1000-b']['max_environment_delay'] == 5.0
+    assert 'targets' not in targets['t2000-a']
+
+
+def test_polling_defaults():
+    config = {'poll_interval': 10.0, 'commands': None}
+    defaulted = with_defaults(config)
+    assert defaulted['max_snapshot_age'] == 30.0, "max age did not follow the poll interval"
+    assert defaulted['commands'] == {}
+    assert defaulted['history_size'] == 0
+    assert config == {'poll_interval': 10.0, 'commands': None}, "defaults leaked into the target's configuration"
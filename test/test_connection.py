@@ -1,5 +1,11 @@
+import socket
+import time
+
 import pytest
 
+from prometheus_client import REGISTRY
+
+from alom.exceptions import PartialResponseException
 from alom.ssh import ALOMConnection
 
 
@@ -33,3 +39,97 @@ def test_connection_backoff(tmp_path):
     # simulate a power-off event
     connection.last_measurement_on = False
     assert connection.get_backoff() == 0.2, "get_backoff did not return to the previous backoff when power cycle changed"
+
+
+def _connection(tmp_path, channel):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text("command_timeout: 0.2\nmax_environment_delay: 0.1\nmin_environment_delay: 0.05\n")
+    connection = ALOMConnection(str(p))
+    connection.channel = channel
+    return connection
+
+
+def test_showenvironment_reads_until_prompt(tmp_path, socket_channel):
+    connection = _connection(tmp_path, socket_channel)
+    with open('test/t2000_on_docs_example.txt', 'rb') as fh:
+        socket_channel.reply(b'showenvironment\r\n' + fh.read() + b'sc> ')
+    started = time.monotonic()
+    env = connection.showenvironment()
+    assert time.monotonic() - started < 0.1, "read did not finish when the prompt arrived"
+    assert 'Environmental Status' in env
+    assert not env.endswith('sc> '), "prompt was left on the response"
+    assert connection.last_measurement_on
+
+
+def test_showenvironment_falls_back_to_backoff(tmp_path, socket_channel):
+    connection = _connection(tmp_path, socket_channel)
+    socket_channel.reply(b'showenvironment\r\nSystem power is off')
+    started = time.monotonic()
+    # Without the prompt there's no telling whether the response is complete
+    with pytest.raises(PartialResponseException):
+        connection.showenvironment()
+    # command_timeout plus the minimum backoff
+    assert time.monotonic() - started >= 0.25
+
+
+def test_showenvironment_discards_stale_output(tmp_path, socket_channel):
+    connection = _connection(tmp_path, socket_channel)
+    # Tail of an earlier response that arrived after its read timed out
+    socket_channel.remote.send(b'PS1     OK              OFF\r\nsc> ')
+    socket_channel.reply(b'showenvironment\r\nSystem power is off\r\nsc> ')
+    assert connection.showenvironment() == 'System power is off\r\n'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_phase_instrumentation(tmp_path, socket_channel):
+    connection = _connection(tmp_path, socket_channel)
+    target = connection.name
+    commands = sample('alom_phase_duration_seconds_count', target=target, phase='command')
+    backoffs = sample('alom_phase_duration_seconds_count', target=target, phase='backoff')
+    increases = sample('alom_backoff_increases_total', target=target)
+    socket_channel.reply(b'showenvironment\r\nSystem power is off')
+    with pytest.raises(PartialResponseException):
+        connection.showenvironment()
+    assert sample('alom_phase_duration_seconds_count', target=target, phase='command') == commands + 1
+    assert sample('alom_phase_duration_seconds_count', target=target, phase='backoff') == backoffs + 1
+    assert sample('alom_phase_duration_seconds_sum', target=target, phase='backoff') >= 0.05
+    connection.increase_backoff()
+    assert sample('alom_backoff_increases_total', target=target) == increases + 1
+    assert sample('alom_backoff_seconds', target=target) == connection.get_backoff() == 0.1
+
+
+def test_open_channel_times_out(tmp_path):
+    # Accepts the TCP connection but never sends an SSH banner
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    try:
+        connection = ALOMConnection(
+            config={
+                'alom_ssh_address': '127.0.0.1',
+                'alom_ssh_port': listener.getsockname()[1],
+                'alom_ssh_username': 'admin',
+                'alom_ssh_password': 'changeme',
+                'connect_timeout': 0.5,
+            }
+        )
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            connection.open_channel()
+        assert time.monotonic() - started < 5, "connecting was not bounded by connect_timeout"
+    finally:
+        listener.close()
+
+
+def test_new_connection_leaves_backoff_gauge(tmp_path):
+    p = tmp_path / "sample_config.yaml"
+    p.write_text("alom_ssh_address: gauge-test\nmax_environment_delay: 3.0\nmin_environment_delay: 0.35\n")
+    connection = ALOMConnection(str(p))
+    connection.last_measurement_on = True
+    connection.backoff_gauge.set(connection.get_backoff())
+    # As built by a reload, for a target which keeps running on its existing connection
+    ALOMConnection(str(p))
+    assert sample('alom_backoff_seconds', target='gauge-test') == 3.0
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from prometheus_client import REGISTRY
+
+from alom.diff import Change, diff
+from alom.events import WebhookSink
+from alom.parse import parse_showenvironment
+from alom.poller import TargetPoller
+
+T2000 = 'test/t2000_on_docs_example.txt'
+# Indicators, a power supply, and a temperature reading, from and to
+EDITS = [
+    ('OFF                  OFF                  ON', 'OFF                  ON                   ON'),
+    (
+        'PS1     OK              OFF         OFF       OFF       OFF        OFF',
+        'PS1     OFF             OFF         ON        OFF       OFF        OFF',
+    ),
+    (
+        'PDB/T_AMB        OK        24    -10      -5       0      45       50     55',
+        'PDB/T_AMB        OK        31    -10      -5       0      45       50     55',
+    ),
+]
+
+
+def edited(lines):
+    replacements = dict(EDITS)
+    return [replacements.get(line, line) for line in lines]
+
+
+def test_identical_responses_have_no_changes(sample_session):
+    lines = sample_session(T2000)
+    assert diff(parse_showenvironment(lines), parse_showenvironment(lines)) == []
+
+
+def test_changes_leave_out_readings(sample_session):
+    lines = sample_session(T2000)
+    previous, current = parse_showenvironment(lines), parse_showenvironment(edited(lines))
+    expected = [
+        Change('indicator', 'SYS/SERVICE', None, 'OFF', 'ON'),
+        Change('psu', 'PS1', 'Status', 1.0, 0.0),
+        Change('psu', 'PS1', 'Overtemp', 0.0, 1.0),
+    ]
+    assert diff(previous, current) == expected
+    # Plain dicts, as built by hand or by older code, give the same changes
+    plain = {
+        category: {name: dict(row) for name, row in table.items()} if category in ('psu', 'fans') else table
+        for category, table in previous.items()
+    }
+    assert sorted(diff(plain, current)) == sorted(expected)
+
+
+def test_power_off_changes(sample_session):
+    previous = parse_showenvironment(sample_session(T2000))
+    current = parse_showenvironment(sample_session('test/t2000_off_docs_example.txt'))
+    changes = diff(previous, current)
+    assert Change('power', 'system', None, 1, 0) in changes
+    assert Change('indicator', 'SYS/ACT', None, 'ON', 'STANDBY BLINK') in changes
+    # Tables which can't be read while powered off are covered by the power change, and rows by one change each
+    assert not any(change.category == 'fans' for change in changes)
+    gone = [change for change in changes if change.category == 'temperature']
+    assert len(gone) == 5
+    assert gone[0] == Change('temperature', 'MB/T_AMB', None, dict(previous['temperature']['MB/T_AMB']), None)
+
+
+def test_poller_reports_changes(fake_connection, tmp_path):
+    events = tmp_path / 'changes.jsonl'
+    connection = fake_connection('changing', T2000)
+    connection.config['change_events_path'] = str(events)
+    poller = TargetPoller(connection)
+    asyncio.run(poller.poll())
+    with open(T2000, 'r') as fh:
+        lines = fh.read().splitlines()
+    changed = tmp_path / 'changed.txt'
+    changed.write_text('\n'.join(edited([line.strip() for line in lines])) + '\n')
+    connection.path = str(changed)
+    asyncio.run(poller.poll())
+    records = [json.loads(line) for line in events.read_text().splitlines()]
+    assert {(record['category'], record['item'], record['field']) for record in records} == {
+        ('indicator', 'SYS/SERVICE', None),
+        ('psu', 'PS1', 'Status'),
+        ('psu', 'PS1', 'Overtemp'),
+    }
+    assert all(record['target'] == 'changing' for record in records)
+    count = REGISTRY.get_sample_value('alom_environment_changes_total', {'target': 'changing', 'category': 'psu'})
+    assert count == 2
+
+
+def test_webhook_posts_batches():
+    received = []
+    done = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.extend(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(204)
+            self.end_headers()
+            if len(received) == 3:
+                done.set()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sink = WebhookSink(f'http://127.0.0.1:{server.server_address[1]}/hook')
+        for number in range(3):
+            sink.write({'number': number})
+        assert done.wait(5), "events were not delivered"
+        assert [record['number'] for record in received] == [0, 1, 2]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from alom.history import Ring, TargetHistory
+from alom.metrics import ALOMCollector
+from alom.poller import Snapshot, TargetPoller
+from alom.server import start_exporter_server
+
+
+def samples(collector):
+    families = text_string_to_metric_families(collector.render().decode('utf-8'))
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value for m in families for s in m.samples}
+
+
+def test_ring_overwrites_oldest():
+    ring = Ring(3)
+    for second in range(5):
+        ring.append(float(second), second * 10.0)
+    assert ring.samples() == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0)]
+    assert ring.summary(since=3.0) == (30.0, 40.0, 35.0)
+    assert ring.summary(since=0.0) == (20.0, 40.0, 30.0)
+    assert ring.summary(since=5.0) is None
+    assert len(ring.values) == 3, "ring grew"
+
+
+def test_history_summarizes_window():
+    history = TargetHistory(size=10, window=15.0)
+    for timestamp, temp in [(100.0, 24.0), (110.0, 61.0), (120.0, 25.0), (130.0, 26.0)]:
+        history.record(Snapshot({'temperature': {'MB/T_AMB': {'Temp': temp, 'Status': 1.0}}}, timestamp))
+    # The spike at 110 is more than 15s before the last sample
+    assert history.summary[('temperature', 'MB/T_AMB')] == (25.0, 26.0, 25.5)
+    (series,) = history.series('MB/T_AMB')
+    assert series['column'] == 'Temp'
+    assert series['values'] == [24.0, 61.0, 25.0, 26.0]
+    assert series['min'] == 25.0
+    assert history.series('nope') == []
+
+
+def test_poller_records_history(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    connection.config.update(history_size=4, history_window=60.0)
+    poller = TargetPoller(connection)
+    for _ in range(6):
+        asyncio.run(poller.poll())
+    ring = poller.history.rings[('fans', 'FT0/FM0')]
+    assert ring.count == 4
+    result = samples(ALOMCollector({'t2000': poller}))
+    labels = (('category', 'temperature'), ('sensor', 'PDB/T_AMB'), ('target', 't2000'))
+    assert result[('alom_sensor_window_max', labels)] == 24
+    assert result[('alom_sensor_window_avg', labels)] == 24
+    # No history is kept unless configured
+    assert TargetPoller(fake_connection('t1000', 'test/t1000_on_0.txt')).history is None
+
+
+def test_history_endpoint(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    connection.config['history_size'] = 8
+    pollers = {
+        't2000': TargetPoller(connection),
+        'plain': TargetPoller(fake_connection('plain', 'test/t2000_on_docs_example.txt')),
+    }
+    asyncio.run(pollers['t2000'].poll())
+    server = start_exporter_server(0, ALOMCollector(pollers), addr='127.0.0.1')
+    url = f'http://127.0.0.1:{server.server_address[1]}/history'
+    try:
+        with urllib.request.urlopen(f'{url}?target=t2000&sensor=PDB/T_AMB') as response:
+            assert response.headers['Content-Type'] == 'application/json'
+            body = json.loads(response.read())
+        assert body['series'][0]['category'] == 'temperature'
+        assert body['series'][0]['values'] == [24.0]
+        for query, code in [('target=t2000', 400), ('target=plain&sensor=PDB/T_AMB', 404), ('target=t2000&sensor=x', 404)]:
+            with pytest.raises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(f'{url}?{query}')
+            assert e.value.code == code
+    finally:
+        server.shutdown()
+        server.server_close()
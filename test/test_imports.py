@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+import pytest
+
+
+def imported_modules(module: str) -> list:
+    """Import a module in a fresh interpreter with -X importtime, and return the name of every module it loaded"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:       324 |      57995 |       prometheus_client", after a header line
+    lines = [line for line in result.stderr.splitlines() if line.startswith('import time:')]
+    return [line.split('|')[2].strip() for line in lines[1:]]
+
+
+@pytest.mark.parametrize(
+    'module,heavy',
+    [
+        ('alom.parse', ('paramiko', 'yaml', 'prometheus_client')),
+        ('alom.parse_power', ('paramiko', 'yaml', 'prometheus_client')),
+        # The exporter needs prometheus_client, but paramiko only once it connects, and yaml only to read its configuration
+        ('alom.metrics', ('paramiko', 'yaml')),
+    ],
+)
+def test_import_leaves_out_heavy_dependencies(module, heavy):
+    modules = imported_modules(module)
+    assert module in modules
+    loaded = [name for name in modules if name.split('.')[0] in heavy]
+    assert not loaded, f'importing {module} loaded {", ".join(loaded)}'
@@ -0,0 +1,25 @@
+import socket
+
+import pytest
+
+from alom.loadtest import percentile, run_load_test
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_short_load_test():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    report = run_load_test(2, 'test/t1000_on_0.txt', duration=1.0, rate=5, delay=0.05, port=port, startup_timeout=30)
+    assert report['healthy_at_startup'] == 2
+    assert report['scrapes'] >= 4
+    assert report['errors'] == 0
+    assert report['min_healthy'] == 2
+    assert report['p99_seconds'] < 1.0
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from prometheus_client import REGISTRY
+
+from alom.commands import COMMANDS
+from alom.logs import LogState, unseen
+from alom.poller import LogPoller
+
+
+class GrowingLog:
+    """Session whose "showlogs -e N" answers with the last N lines of a log the test appends to"""
+
+    def __init__(self, name, tmp_path, **config):
+        self.name = name
+        self.lines = ['Searching for the last events...', '']
+        self.requests = []
+        self.config = {'log_window': 4, 'max_log_window': 32, 'log_state_path': str(tmp_path / 'state.json')}
+        self.config.update(config)
+
+    def add(self, count, severity='minor'):
+        start = len(self.lines)
+        for number in range(start, start + count):
+            self.lines.append(f'Feb 13 09:{number // 60:02d}:{number % 60:02d}: Chassis |{severity}   : "Event {number}"')
+
+    async def run_command(self, command):
+        self.requests.append(command)
+        window = int(command.split()[-1])
+        return '\n'.join(self.lines[-window:])
+
+    def increase_backoff(self):
+        pass
+
+
+def logged(target, severity):
+    labels = {'target': target, 'command': 'showlogs', 'severity': severity, 'source': 'Chassis'}
+    return REGISTRY.get_sample_value('alom_log_events_total', labels) or 0
+
+
+def test_unseen():
+    events = [{'time': '', 'source': 'console', 'message': line} for line in 'abcabd']
+    assert [e['message'] for e in unseen(events, ['\x1f'.join(('', 'console', 'a')), '\x1f'.join(('', 'console', 'b'))])[0]] == ['d']
+    assert unseen(events, ['missing']) == (events, False)
+
+
+def test_reads_only_new_entries(tmp_path):
+    session = GrowingLog('incremental', tmp_path)
+    session.add(20)
+    poller = LogPoller(session, COMMANDS['showlogs'])
+    # With no cursor only the initial window is read
+    assert asyncio.run(poller.poll())
+    assert session.requests == ['showlogs -e 4']
+    assert logged('incremental', 'minor') == 4
+    # New entries inside the window need a single request
+    session.add(2, 'major')
+    session.requests.clear()
+    asyncio.run(poller.poll())
+    assert session.requests == ['showlogs -e 4']
+    assert [event['message'] for event in poller.snapshot.data] == ['Event 22', 'Event 23']
+    assert logged('incremental', 'major') == 2
+    # More entries than the window doubles the request until the cursor turns up
+    session.add(10)
+    session.requests.clear()
+    asyncio.run(poller.poll())
+    assert session.requests == ['showlogs -e 4', 'showlogs -e 8', 'showlogs -e 16']
+    assert len(poller.snapshot.data) == 10
+    assert logged('incremental', 'minor') == 14
+
+
+def test_cursor_survives_restart(tmp_path):
+    events_path = tmp_path / 'events.jsonl'
+    session = GrowingLog('restarted', tmp_path, log_events_path=str(events_path))
+    session.add(6)
+    asyncio.run(LogPoller(session, COMMANDS['showlogs']).poll())
+    session.add(1, 'critical')
+    # A new poller, as after a restart, picks up from the saved cursor
+    poller = LogPoller(session, COMMANDS['showlogs'])
+    poller.state = LogState(session.config['log_state_path'])
+    asyncio.run(poller.poll())
+    assert [event['message'] for event in poller.snapshot.data] == ['Event 8']
+    records = [json.loads(line) for line in events_path.read_text().splitlines()]
+    assert len(records) == 5
+    assert records[-1]['severity'] == 'critical'
+    assert records[-1]['target'] == 'restarted'
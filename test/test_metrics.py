@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from alom.metrics import ALOMCollector
+from alom.poller import TargetPoller
+
+
+def polled(**connections):
+    pollers = {name: TargetPoller(connection) for name, connection in connections.items()}
+    for poller in pollers.values():
+        asyncio.run(poller.poll())
+    return pollers
+
+
+def samples(collector):
+    families = text_string_to_metric_families(collector.render().decode('utf-8'))
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value for m in families for s in m.samples}
+
+
+def test_collect_labels_each_target(fake_connection):
+    pollers = polled(
+        t2000=fake_connection('t2000', 'test/t2000_on_docs_example.txt'),
+        t1000=fake_connection('t1000', 'test/t1000_off.txt'),
+    )
+    result = samples(ALOMCollector(pollers))
+    assert result[('alom_ok', (('target', 't2000'),))] == 1
+    assert result[('alom_ok', (('target', 't1000'),))] == 1
+    assert result[('alom_system_power', (('target', 't1000'),))] == 0
+    assert result[('alom_system_temperature', (('sensor', 'PDB/T_AMB'), ('target', 't2000')))] == 24
+    assert result[('alom_system_temperature', (('sensor', 'MB/T_AMB'), ('target', 't1000')))] == 25
+    assert result[('alom_power_supply_status', (('supply', 'PS1'), ('target', 't2000')))] == 1
+    assert result[('alom_last_scrape_timestamp_seconds', (('target', 't2000'),))] > 0
+
+
+def test_collect_partial_response_isolated(fake_connection):
+    broken = fake_connection('broken')
+    pollers = polled(t2000=fake_connection('t2000', 'test/t2000_on_docs_example.txt'), broken=broken)
+    result = samples(ALOMCollector(pollers))
+    assert result[('alom_ok', (('target', 'broken'),))] == 0
+    assert result[('alom_ok', (('target', 't2000'),))] == 1
+    assert broken.backoff_increases == 1, "partial response did not increase backoff"
+    assert REGISTRY.get_sample_value('alom_partial_responses_total', {'target': 'broken'}) >= 1
+    sensor_metrics = [name for name, labels in result if ('target', 'broken') in labels and 'session' not in name]
+    assert sensor_metrics == ['alom_ok'], "sensor metrics present for a target without data"
+
+
+def test_collect_every_column(fake_connection):
+    pollers = polled(t2000=fake_connection('t2000', 'test/t2000_on_docs_example.txt'))
+    result = samples(ALOMCollector(pollers))
+    sensor = (('sensor', 'MB/CMP0/T_TCORE'), ('target', 't2000'))
+    assert result[('alom_system_temperature_status', sensor)] == 1
+    threshold = lambda name: (('sensor', 'MB/CMP0/T_TCORE'), ('target', 't2000'), ('threshold', name))
+    assert result[('alom_system_temperature_threshold', threshold('HighHard'))] == 105
+    assert result[('alom_system_temperature_threshold', threshold('LowHard'))] == -10
+    fan = (('sensor', 'FT0/FM0'), ('target', 't2000'), ('threshold', 'Low'))
+    assert result[('alom_fan_speed_threshold', fan)] == 1920
+    load = (('sensor', 'MB/I_VCORE'), ('target', 't2000'), ('threshold', 'Shutdown'))
+    assert result[('alom_system_load_threshold', load)] == 88
+    fault = (('fault', 'Overtemp'), ('supply', 'PS0'), ('target', 't2000'))
+    assert result[('alom_power_supply_fault', fault)] == 0
+    assert ('alom_voltage_threshold', (('sensor', 'MB/V_VCORE'), ('target', 't2000'), ('threshold', 'LowWarn'))) in result
+
+
+def test_collect_indicators_and_disks(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    pollers = polled(t2000=connection)
+    collector = ALOMCollector(pollers)
+    result = samples(collector)
+    state = lambda indicator, name: (
+        'alom_indicator_status',
+        (('alom_indicator_status', name), ('indicator', indicator), ('target', 't2000')),
+    )
+    assert result[state('SYS/ACT', 'ON')] == 1
+    assert result[state('SYS/ACT', 'OFF')] == 0
+    assert result[state('SYS/LOCATE', 'FAST BLINK')] == 0
+    assert result[('alom_disk_present', (('disk', 'HDD0'), ('target', 't2000')))] == 1
+    assert result[('alom_disk_present', (('disk', 'HDD1'), ('target', 't2000')))] == 0
+    assert result[('alom_disk_status', (('disk', 'HDD1'), ('target', 't2000')))] == -1
+    assert result[('alom_disk_indicator', (('disk', 'HDD0'), ('indicator', 'OK2RM'), ('target', 't2000')))] == 0
+    # Samples for an indicator in a state it was in before are reused, and unknown states are exported too
+    exposition = collector.targets['t2000']
+    cached = exposition.indicators[('SYS/ACT', 'ON')]
+    snapshot = pollers['t2000'].snapshot
+    indicators = dict(snapshot.data['indicator'], **{'SYS/SERVICE': 'ON', 'SYS/LOCATE': 'SOMETHING NEW'})
+    pollers['t2000'].snapshot = snapshot._replace(data=dict(snapshot.data, indicator=indicators))
+    result = samples(collector)
+    assert exposition.indicators[('SYS/ACT', 'ON')] is cached
+    assert result[state('SYS/SERVICE', 'ON')] == 1
+    assert result[state('SYS/SERVICE', 'OFF')] == 0
+    assert result[state('SYS/LOCATE', 'SOMETHING NEW')] == 1
+    assert result[state('SYS/LOCATE', 'OFF')] == 0
+
+
+def test_render_reuses_unchanged_output(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    pollers = polled(t2000=connection)
+    collector = ALOMCollector(pollers)
+    collector.render()
+    body = collector._body
+    collector.render()
+    assert collector._body is body, "sensor samples were re-rendered without a new snapshot"
+    exposition = collector.targets['t2000']
+    temperature = exposition.chunks['alom_system_temperature']
+    voltage = exposition.chunks['alom_voltage_status']
+    thresholds = exposition.chunks['alom_voltage_threshold']
+    # Same readings apart from one voltage
+    snapshot = pollers['t2000'].snapshot
+    data = dict(snapshot.data)
+    data['voltage'] = dict(data['voltage'])
+    data['voltage']['MB/V_VCORE'] = dict(data['voltage']['MB/V_VCORE'], Voltage=1.5)
+    pollers['t2000'].snapshot = snapshot._replace(data=data)
+    result = samples(collector)
+    assert exposition.chunks['alom_system_temperature'] is temperature, "unchanged category was re-rendered"
+    assert exposition.chunks['alom_voltage_threshold'] is thresholds, "unchanged thresholds were re-rendered"
+    assert exposition.chunks['alom_voltage_status'] is not voltage
+    assert result[('alom_voltage_status', (('sensor', 'MB/V_VCORE'), ('target', 't2000')))] == 1.5
+
+
+def test_collect_after_targets_replaced(fake_connection):
+    collector = ALOMCollector(polled(a=fake_connection('a')))
+    assert ('alom_ok', (('target', 'a'),)) in samples(collector)
+    # The same snapshots (none) for a different set of targets must not be mistaken for an unchanged body
+    collector.pollers = polled(b=fake_connection('b'))
+    result = samples(collector)
+    assert ('alom_ok', (('target', 'b'),)) in result
+    assert ('alom_ok', (('target', 'a'),)) not in result
+    assert list(collector.targets) == ['b'], "cached exposition of a removed target was kept"
+
+
+def test_collect_times_parse_and_render(fake_connection):
+    labels = lambda phase: {'target': 'timed', 'phase': phase}
+    parsed = REGISTRY.get_sample_value('alom_phase_duration_seconds_count', labels('parse')) or 0
+    collector = ALOMCollector(polled(timed=fake_connection('timed', 'test/t2000_on_docs_example.txt')))
+    collector.render()
+    collector.render()
+    assert REGISTRY.get_sample_value('alom_phase_duration_seconds_count', labels('parse')) == parsed + 1
+    # The second render reused the exposition, so only one render was timed
+    assert REGISTRY.get_sample_value('alom_phase_duration_seconds_count', labels('render')) == 1
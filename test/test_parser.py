@@ -1,6 +1,16 @@
 import pytest
 
-from alom.parse import parse_showenvironment, atoi
+from alom.exceptions import PartialResponseException
+from alom.parse import parse_showenvironment, parse_showenvironment_bytes, atoi
+
+ENVIRONMENTS = [
+    'test/t1000_off.txt',
+    'test/t1000_on_0.txt',
+    'test/t1000_on_1.txt',
+    'test/t1000_on_docs_example.txt',
+    'test/t2000_off_docs_example.txt',
+    'test/t2000_on_docs_example.txt',
+]
 
 
 def test_atoi():
@@ -252,3 +262,36 @@ def test_t2000_on(sample_session):
     # Power supplies
     assert result['psu']['PS0']['Status'] == 1
     assert result['psu']['PS1']['Status'] == 1
+
+
+def test_truncated_row_is_partial(sample_session):
+    test = sample_session('test/t2000_on_docs_example.txt')
+    # Cut the response off in the middle of the voltage table
+    cutoff = test.index('MB/V_VTTL       OK            0.89    0.76    0.81    0.99     1.03')
+    test = test[:cutoff] + ['MB/V_VTTL       OK            0.89']
+    with pytest.raises(PartialResponseException):
+        parse_showenvironment(test)
+
+
+@pytest.mark.parametrize('path', ENVIRONMENTS)
+def test_bytes_parser_matches(sample_session, path):
+    with open(path, 'rb') as fh:
+        raw = fh.read()
+    expected = parse_showenvironment(sample_session(path))
+    assert parse_showenvironment_bytes(raw) == expected
+    # With the "\r\n" line endings the ALOM sends
+    assert parse_showenvironment_bytes(raw.replace(b'\n', b'\r\n')) == expected
+    assert parse_showenvironment_bytes(memoryview(raw)) == expected
+    assert parse_showenvironment_bytes(bytearray(raw)) == expected
+
+
+def test_bytes_parser_truncated_is_partial():
+    with open('test/t2000_on_docs_example.txt', 'rb') as fh:
+        raw = fh.read()
+    # Cut off in the middle of a row, and right after a table header
+    row = raw.index(b'MB/V_VTTL       OK            0.89    0.76')
+    with pytest.raises(PartialResponseException):
+        parse_showenvironment_bytes(raw[: row + len(b'MB/V_VTTL       OK            0.89')])
+    header = raw.index(b'Fans (Speeds Revolution Per Minute):')
+    with pytest.raises(PartialResponseException):
+        parse_showenvironment_bytes(raw[: header + len(b'Fans (Speeds Revolution Per Minute):\n')])
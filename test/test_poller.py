@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+
+from alom.metrics import ALOMCollector, reload
+from alom.poller import Poller, TargetPoller, poll_forever
+
+
+def test_poll_keeps_last_good_snapshot(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    poller = TargetPoller(connection)
+    assert poller.current() is None, "snapshot present before the first poll"
+    assert asyncio.run(poller.poll())
+    snapshot = poller.current()
+    assert snapshot.data['temperature']['PDB/T_AMB']['Temp'] == 24
+    # A failed poll flags the target but doesn't throw away good data
+    connection.path = None
+    assert not asyncio.run(poller.poll())
+    assert not poller.last_poll_ok
+    assert poller.current() is snapshot
+
+
+def test_snapshot_max_age(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    poller = TargetPoller(connection)
+    asyncio.run(poller.poll())
+    timestamp = poller.snapshot.timestamp
+    assert poller.current(timestamp + 90.0) is not None
+    assert poller.current(timestamp + 90.1) is None, "snapshot older than max age was returned"
+
+
+def test_reload_keeps_unchanged_targets(fake_connection):
+    kept = fake_connection('kept', 'test/t2000_on_docs_example.txt')
+    dropped = fake_connection('dropped', 'test/t1000_off.txt')
+    edited = fake_connection('edited', 'test/t1000_off.txt')
+    poller = Poller({'kept': kept, 'dropped': dropped, 'edited': edited})
+    poller.start()
+    try:
+        time.sleep(0.1)
+        running = poller.targets['kept']
+        snapshot = running.snapshot
+        assert snapshot is not None
+        edited_again = fake_connection('edited', 'test/t1000_off.txt')
+        edited_again.config['poll_interval'] = 60.0
+        added, removed, changed = poller.reload(
+            {
+                'kept': fake_connection('kept', 'test/t2000_on_docs_example.txt'),
+                'edited': edited_again,
+                'new': fake_connection('new', 'test/t1000_on_0.txt'),
+            }
+        )
+        assert (added, removed, changed) == (['new'], ['dropped'], ['edited'])
+        assert poller.targets['kept'] is running, "unchanged target was restarted"
+        assert poller.targets['kept'].snapshot is snapshot
+        assert poller.targets['edited'].session is edited_again
+        assert dropped.closed and edited.closed and not kept.closed
+        time.sleep(0.1)
+        assert poller.targets['new'].snapshot is not None, "added target was not polled"
+    finally:
+        poller.stop()
+
+
+def test_reload_with_unknown_command_keeps_running(fake_connection, tmp_path):
+    kept = fake_connection('kept', 'test/t2000_on_docs_example.txt')
+    dropped = fake_connection('dropped', 'test/t1000_off.txt')
+    poller = Poller({'kept': kept, 'dropped': dropped})
+    collector = ALOMCollector(poller.targets)
+    poller.start()
+    try:
+        running = dict(poller.targets)
+        edited = fake_connection('kept', 'test/t2000_on_docs_example.txt')
+        edited.config['commands'] = {'showfaults': None, 'nosuchcommand': None}
+        with pytest.raises(Exception, match='nosuchcommand'):
+            poller.reload({'kept': edited, 'new': fake_connection('new', 'test/t1000_on_0.txt')})
+        assert poller.targets == running
+        assert not kept.closed and not dropped.closed, "a target was stopped by a reload which failed"
+        # From the configuration file, as on SIGHUP or --watch, the failure is logged rather than raised
+        config = tmp_path / 'config.yaml'
+        config.write_text('alom_ssh_address: 192.168.1.231\ncommands:\n  nosuchcommand:\n')
+        reload(str(config), poller, collector)
+        assert poller.targets == running
+        assert collector.pollers == running
+        time.sleep(0.1)
+        assert poller.targets['kept'].snapshot is not None, "target stopped polling after a failed reload"
+    finally:
+        poller.stop()
+
+
+def test_refresh_from_another_thread(fake_connection):
+    poller = Poller({'t2000': fake_connection('t2000', 'test/t2000_on_docs_example.txt')})
+    poller.start()
+    try:
+        time.sleep(0.05)
+        before = poller.targets['t2000'].snapshot
+        assert poller.refresh('t2000', 1.0)
+        assert poller.targets['t2000'].snapshot is not before
+        assert not poller.refresh('missing', 1.0)
+    finally:
+        poller.stop()
+
+
+def test_failed_poll_retried_sooner(monkeypatch):
+    results = iter([True, False, False, False, False, True, False])
+    delays = []
+
+    async def poll():
+        return next(results)
+
+    async def sleep(delay):
+        delays.append(round(delay))
+        if len(delays) == 7:
+            raise asyncio.CancelledError()
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(poll_forever(poll, 30.0, 5.0))
+    assert delays == [30, 5, 10, 20, 30, 30, 5]
+
+
+def test_snapshot_age_served_while_failing(fake_connection):
+    connection = fake_connection('t2000', 'test/t2000_on_docs_example.txt')
+    poller = TargetPoller(connection)
+    asyncio.run(poller.poll())
+    poller.snapshot = poller.snapshot._replace(timestamp=time.time() - 60)
+    connection.path = None
+    asyncio.run(poller.poll())
+    text = ALOMCollector({'t2000': poller}).render().decode('utf-8')
+    # The last good data is still served, flagged by alom_ok and its age
+    assert 'alom_system_temperature{target="t2000",sensor="PDB/T_AMB"} 24.0\n' in text
+    assert 'alom_ok{target="t2000"} 0.0\n' in text
+    age = float(text.split('alom_snapshot_age_seconds{target="t2000"} ')[1].split()[0])
+    assert 60 <= age < 70
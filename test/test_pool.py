@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from alom.pool import ManagedSession, jittered
+
+
+class FlakySession:
+    """AsyncALOMSession stand-in which fails to connect a set number of times and can be killed"""
+
+    def __init__(self, failed_connects=0):
+        self.name = 'flaky'
+        self.config = {
+            'keepalive_interval': 0.02,
+            'reconnect_min_delay': 0.01,
+            'reconnect_max_delay': 0.04,
+            'command_timeout': 1.0,
+            'min_command_gap': 0.0,
+        }
+        self.failed_connects = failed_connects
+        self.opens = 0
+        self.keepalives = 0
+        self.alive = False
+
+    async def open(self):
+        self.opens += 1
+        if self.failed_connects:
+            self.failed_connects -= 1
+            raise OSError('connection refused')
+        self.alive = True
+
+    def close(self):
+        self.alive = False
+
+    async def keepalive(self):
+        if not self.alive:
+            raise OSError('Socket is closed')
+        self.keepalives += 1
+
+    async def showenvironment(self):
+        if not self.alive:
+            raise OSError('Socket is closed')
+        return b'Environmental Status'
+
+
+def test_jittered_within_bounds():
+    for _ in range(100):
+        assert 5.0 <= jittered(10.0) <= 10.0
+
+
+def test_reconnects_after_failed_command():
+    session = FlakySession()
+
+    async def _run():
+        managed = ManagedSession(session)
+        await managed.open()
+        assert managed.up
+        session.alive = False
+        with pytest.raises(OSError):
+            await managed.showenvironment()
+        assert not managed.up
+        with pytest.raises(ConnectionError):
+            await managed.showenvironment()
+        await asyncio.sleep(0.01)
+        assert managed.up, "session was not reopened in the background"
+        assert await managed.showenvironment() == b'Environmental Status'
+        managed.close()
+
+    asyncio.run(_run())
+    assert session.opens == 2
+
+
+def test_retries_until_connected_and_keeps_alive():
+    session = FlakySession(failed_connects=2)
+
+    async def _run():
+        managed = ManagedSession(session)
+        await managed.open()
+        assert not managed.up, "first attempt should have failed"
+        await asyncio.sleep(0.2)
+        assert managed.up
+        managed.close()
+
+    asyncio.run(_run())
+    assert session.opens == 3
+    assert session.keepalives > 0, "idle session was not kept alive"
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from alom.aio import AsyncALOMSession
+from alom.parse import parse_showenvironment, parse_showenvironment_bytes
+from alom.replay import REDACTED, RecordingChannel, ReplaySession
+from alom.ssh import ALOMConnection
+
+
+def target_config(server, **extra):
+    config = {
+        'alom_ssh_address': '127.0.0.1',
+        'alom_ssh_port': server.port,
+        'alom_ssh_username': 'admin',
+        'alom_ssh_password': 'changeme',
+        'alom_authentication_delay': 0.1,
+        'command_timeout': 2.0,
+    }
+    config.update(extra)
+    return config
+
+
+def parsed(env):
+    return parse_showenvironment([line.strip() for line in env.splitlines()])
+
+
+def test_sync_connection_against_fake(fake_alom):
+    server = fake_alom()
+    with ALOMConnection(config=target_config(server), name='fake') as connection:
+        data = parsed(connection.showenvironment())
+    assert data['temperature']['PDB/T_AMB']['Temp'] == 24
+    assert data['disk']['HDD1']['Status'] == -1.0
+
+
+def test_async_session_against_fake(fake_alom):
+    server = fake_alom()
+
+    async def _run():
+        session = await AsyncALOMSession(ALOMConnection(config=target_config(server), name='fake')).open()
+        try:
+            first = await session.showenvironment()
+            await session.keepalive()
+            second = await session.showenvironment()
+        finally:
+            session.close()
+        return first, second
+
+    first, second = asyncio.run(_run())
+    assert parse_showenvironment_bytes(first) == parse_showenvironment_bytes(second)
+    assert parse_showenvironment_bytes(first)['fans']['FT2']['Speed'] == 2455
+
+
+def test_record_and_replay(fake_alom, tmp_path):
+    recording = tmp_path / 'session.jsonl'
+    server = fake_alom()
+    with ALOMConnection(config=target_config(server, record_path=str(recording)), name='fake') as connection:
+        original = connection.showenvironment()
+    events = [json.loads(line) for line in recording.read_text().splitlines()]
+    sent = [event['data'] for event in events if event['dir'] == 'send']
+    assert sent == ['admin\n', REDACTED + '\n', 'showenvironment\n'], "password was not redacted"
+    # The recording replays to a client using a different password
+    replayed = fake_alom(ReplaySession.load(str(recording)), speed=0.0)
+    config = target_config(replayed, alom_ssh_password='other')
+    with ALOMConnection(config=config, name='replayed') as connection:
+        assert parsed(connection.showenvironment()) == parsed(original)
+
+
+def test_password_redacted_when_prompt_split(tmp_path):
+    class Channel:
+        def __init__(self, chunks):
+            self.chunks = list(chunks)
+
+        def recv(self, nbytes):
+            return self.chunks.pop(0)
+
+        def send(self, data):
+            return len(data)
+
+    path = tmp_path / 'recording.jsonl'
+    # The prompt split across reads, then followed by a chunk of its own
+    channel = RecordingChannel(Channel([b'Please Enter pass', b'word:', b' ', b'sc> ']), str(path))
+    for _ in range(3):
+        channel.recv(4096)
+    channel.send('changeme\n')
+    channel.recv(4096)
+    channel.send('showenvironment\n')
+    sent = [json.loads(line)['data'] for line in path.read_text().splitlines() if '"send"' in line]
+    assert sent == [REDACTED + '\n', 'showenvironment\n'], "password was not redacted"
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from alom.scheduler import CommandScheduler
+
+
+class Recorder:
+    """Coroutine functions which log when they start and finish"""
+
+    def __init__(self):
+        self.events = []
+        self.calls = 0
+
+    def command(self, name, duration=0.02, fail=False):
+        async def _command():
+            self.calls += 1
+            loop = asyncio.get_running_loop()
+            self.events.append(('start', name, loop.time()))
+            await asyncio.sleep(duration)
+            self.events.append(('end', name, loop.time()))
+            if fail:
+                raise OSError(name)
+            return name
+
+        return _command
+
+
+def test_commands_are_serialized_with_gap():
+    recorder = Recorder()
+
+    async def _run():
+        scheduler = CommandScheduler('test', min_gap=0.05)
+        return await asyncio.gather(
+            scheduler.run('a', recorder.command('a')),
+            scheduler.run('b', recorder.command('b')),
+        )
+
+    assert asyncio.run(_run()) == ['a', 'b']
+    kinds = [kind for kind, _, _ in recorder.events]
+    assert kinds == ['start', 'end', 'start', 'end'], "commands overlapped on the channel"
+    assert recorder.events[2][2] - recorder.events[1][2] >= 0.045, "minimum gap was not enforced"
+
+
+def test_concurrent_requests_coalesce():
+    recorder = Recorder()
+
+    async def _run():
+        scheduler = CommandScheduler('test', min_gap=0.0)
+        results = await asyncio.gather(*[scheduler.run('env', recorder.command('env')) for _ in range(5)])
+        # Once finished, the next request runs the command again
+        results.append(await scheduler.run('env', recorder.command('env')))
+        return results, scheduler.depth
+
+    results, depth = asyncio.run(_run())
+    assert results == ['env'] * 6
+    assert recorder.calls == 2, "concurrent requests were not coalesced"
+    assert depth == 0
+
+
+def test_failure_is_shared_and_not_sticky():
+    recorder = Recorder()
+
+    async def _run():
+        scheduler = CommandScheduler('test', min_gap=0.0)
+        outcomes = await asyncio.gather(
+            *[scheduler.run('env', recorder.command('env', fail=True)) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(outcome, OSError) for outcome in outcomes)
+        return await scheduler.run('env', recorder.command('env'))
+
+    assert asyncio.run(_run()) == 'env'
+    assert recorder.calls == 2
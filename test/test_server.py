@@ -0,0 +1,68 @@
+import asyncio
+import urllib.error
+import urllib.request
+
+import pytest
+
+from alom.metrics import ALOMCollector
+from alom.poller import TargetPoller
+from alom.server import start_exporter_server
+
+
+@pytest.fixture
+def server(fake_connection):
+    poller = TargetPoller(fake_connection('t2000', 'test/t2000_on_docs_example.txt'))
+    asyncio.run(poller.poll())
+    server = start_exporter_server(0, ALOMCollector({'t2000': poller}), addr='127.0.0.1')
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_metrics_endpoint(server):
+    with urllib.request.urlopen(f'{server}/metrics') as response:
+        body = response.read().decode('utf-8')
+    assert 'alom_system_temperature{target="t2000",sensor="PDB/T_AMB"} 24.0\n' in body
+    assert 'alom_ok{target="t2000"} 1.0\n' in body
+    assert 'process_' in body or 'python_info' in body, "exporter's own metrics missing"
+
+
+def test_unknown_path(server):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(f'{server}/nope')
+    assert e.value.code == 404
+
+
+def test_probe_one_target(fake_connection):
+    pollers = {
+        name: TargetPoller(fake_connection(name, 'test/t2000_on_docs_example.txt')) for name in ('fresh', 'stale')
+    }
+    asyncio.run(pollers['fresh'].poll())
+    refreshed = []
+
+    def refresh(target, timeout):
+        refreshed.append((target, timeout))
+        return asyncio.run(pollers[target].poll())
+
+    server = start_exporter_server(0, ALOMCollector(pollers, refresh), addr='127.0.0.1')
+    url = f'http://127.0.0.1:{server.server_address[1]}/probe'
+    try:
+        with urllib.request.urlopen(f'{url}?target=fresh') as response:
+            body = response.read().decode('utf-8')
+        assert 'alom_ok{target="fresh"} 1.0\n' in body
+        assert 'target="stale"' not in body
+        assert 'process_' not in body and 'python_info' not in body
+        assert refreshed == [], "fresh target was refreshed"
+        # A target without a fresh snapshot is polled before answering, within Prometheus' timeout
+        request = urllib.request.Request(f'{url}?target=stale', headers={'X-Prometheus-Scrape-Timeout-Seconds': '5'})
+        with urllib.request.urlopen(request) as response:
+            body = response.read().decode('utf-8')
+        assert refreshed == [('stale', 4.5)]
+        assert 'alom_system_temperature{target="stale",sensor="PDB/T_AMB"} 24.0\n' in body
+        for query, code in (('?target=missing', 404), ('', 400)):
+            with pytest.raises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(f'{url}{query}')
+            assert e.value.code == code
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,96 @@
+import json
+import pickle
+import time
+
+from prometheus_client import REGISTRY
+
+from alom.metrics import ALOMCollector
+from alom.poller import Snapshot
+from alom.logs import state_for
+from alom.shard import RemoteTarget, ShardedPoller, TargetState, changed, resume_cursors, saved_cursors, shard_of, split
+
+
+def test_split_is_stable():
+    targets = {f'target{number}': {} for number in range(100)}
+    shards = split(targets, 4)
+    assert sum(len(shard) for shard in shards) == 100
+    assert all(shards), "a worker was left without targets"
+    assert shards == split(targets, 4)
+    assert shard_of('t2000-a', 4) == shard_of('t2000-a', 4)
+
+
+def test_only_changes_are_sent():
+    snapshot = Snapshot({'power': {'system': 1}}, 1600000000.0)
+    state = TargetState('a', snapshot, 90.0, True, 1600000000.0, {'showfaults': (None, 900.0)}, {})
+    assert changed(state, None)
+    assert not changed(state._replace(), state)
+    # An equal but newly received snapshot is a change
+    assert changed(state._replace(snapshot=Snapshot(snapshot.data, snapshot.timestamp)), state)
+    assert changed(state._replace(commands={'showfaults': (snapshot, 900.0)}), state)
+
+
+def test_remote_target_renders_like_local():
+    target = RemoteTarget('a', {})
+    data = {'power': {'system': 0}, 'temperature': {'MB/T_AMB': {'Temp': 25.0}}}
+    target.update(TargetState('a', Snapshot(data, time.time()), 90.0, True, time.time(), {}, {}))
+    text = ALOMCollector({'a': target}).render().decode('utf-8')
+    assert 'alom_system_temperature{target="a",sensor="MB/T_AMB"} 25.0' in text
+    assert 'alom_ok{target="a"} 1.0' in text
+
+
+def test_remote_target_keeps_history():
+    target = RemoteTarget('a', {'history_size': 4})
+    snapshot = Snapshot({'power': {'system': 1}, 'fans': {'FT0/F0': {'Speed': 8967.0}}}, time.time())
+    state = TargetState('a', snapshot, 90.0, True, time.time(), {}, {})
+    # States arrive pickled, so the same snapshot sent again is an equal copy rather than the same object
+    target.update(pickle.loads(pickle.dumps(state)))
+    # The same snapshot sent again, with a state change, isn't recorded twice
+    target.update(pickle.loads(pickle.dumps(state._replace(last_poll_ok=False))))
+    assert target.history.series('FT0/F0')[0]['values'] == [8967.0]
+
+
+def test_front_process_saves_log_cursors(tmp_path):
+    path = tmp_path / 'state.json'
+    config = {'log_state_path': str(path), 'commands': {'showlogs': None}}
+    targets = {name: RemoteTarget(name, config) for name in ('cursor-a', 'cursor-b')}
+    snapshot = Snapshot({'power': {'system': 1}}, time.time())
+    # Each worker sends the cursors of its own targets only, and neither overwrites the other's
+    for name, cursor in (('cursor-a', ['a1']), ('cursor-b', ['b1'])):
+        targets[name].update(TargetState(name, snapshot, 90.0, True, time.time(), {}, {f'{name}/showlogs': cursor}))
+    assert json.loads(path.read_text()) == {'cursor-a/showlogs': ['a1'], 'cursor-b/showlogs': ['b1']}
+    # A (re)started worker resumes from them, unless it has moved past them already
+    cursors = saved_cursors({'cursor-a': config, 'cursor-b': config})
+    assert cursors == {'cursor-a/showlogs': ['a1'], 'cursor-b/showlogs': ['b1']}
+    state_for(None).set('cursor-b/showlogs', ['b2'])
+    resume_cursors(cursors)
+    assert state_for(None).get('cursor-a/showlogs') == ['a1']
+    assert state_for(None).get('cursor-b/showlogs') == ['b2']
+
+
+def test_workers_poll_their_shard(fake_alom):
+    servers = [fake_alom() for _ in range(3)]
+    targets = {
+        f'fake{number}': {
+            'alom_ssh_address': '127.0.0.1',
+            'alom_ssh_port': server.port,
+            'alom_ssh_username': 'admin',
+            'alom_ssh_password': 'changeme',
+            'command_timeout': 2.0,
+        }
+        for number, server in enumerate(servers)
+    }
+    poller = ShardedPoller(targets, 2)
+    poller.start()
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline and not all(target.snapshot for target in poller.targets.values()):
+            time.sleep(0.2)
+        assert all(target.last_poll_ok for target in poller.targets.values())
+        assert poller.targets['fake0'].snapshot.data['temperature']['PDB/T_AMB']['Temp'] == 24
+        # Workers' instrumentation is served from the front process
+        while time.monotonic() < deadline and not poller.collect():
+            time.sleep(0.2)
+        labels = {'target': 'fake2', 'command': 'showenvironment'}
+        assert REGISTRY.get_sample_value('alom_command_duration_seconds_count', labels) >= 1
+    finally:
+        poller.stop()
@@ -0,0 +1,42 @@
+import pickle
+
+from alom.parse import parse_showenvironment, parse_showenvironment_bytes
+from alom.snapshot import Table, column_items, schema_for
+
+
+def test_table_behaves_like_dict():
+    table = Table(schema_for(['Status', 'Temp']))
+    table.append('MB/T_AMB', [1.0, 24.0])
+    table.append('MB/CMP0/T_TCORE', [1.0, 37.0])
+    # A sensor listed twice keeps its last values, as it would in a dict
+    table.append('MB/T_AMB', [1.0, 25.0])
+    expected = {'MB/T_AMB': {'Status': 1.0, 'Temp': 25.0}, 'MB/CMP0/T_TCORE': {'Status': 1.0, 'Temp': 37.0}}
+    assert table == expected
+    assert list(table) == ['MB/T_AMB', 'MB/CMP0/T_TCORE']
+    assert table['MB/T_AMB']['Temp'] == 25.0
+    assert table['MB/T_AMB'].get('Speed') is None
+    assert dict(table['MB/CMP0/T_TCORE']) == expected['MB/CMP0/T_TCORE']
+    assert 'MB/T_AMB' in table and 'nope' not in table
+    assert table.get('nope') is None
+    assert list(table.column('Temp')) == [25.0, 37.0]
+    assert table.column('Speed') is None
+    assert column_items(table, 'Temp') == column_items(expected, 'Temp') == [('MB/T_AMB', 25.0), ('MB/CMP0/T_TCORE', 37.0)]
+
+
+def test_snapshots_share_schema_and_names(sample_session):
+    lines = sample_session('test/t2000_on_docs_example.txt')
+    first, second = parse_showenvironment(lines), parse_showenvironment(lines)
+    assert first['temperature'].schema is second['temperature'].schema
+    assert first['temperature'].names[0] is second['temperature'].names[0]
+    with open('test/t2000_on_docs_example.txt', 'rb') as fh:
+        from_bytes = parse_showenvironment_bytes(fh.read())
+    assert from_bytes['temperature'].schema is first['temperature'].schema
+
+
+def test_table_pickles(sample_session):
+    data = parse_showenvironment(sample_session('test/t1000_on_0.txt'))
+    restored = pickle.loads(pickle.dumps(data))
+    assert restored == data
+    # Unpickled tables share the schema and sensor names of tables parsed in this process
+    assert restored['fans'].schema is data['fans'].schema
+    assert restored['fans'].names[0] is data['fans'].names[0]